@@ -8,13 +8,26 @@ from tabulate import tabulate
 from scipy import constants
 from sample_norms import N_expect
 from pathlib import Path
-from cut_flow_functions import events,cut1,cut2,cut4,cut5,cut6,calc_p
+from cut_flow_functions import truth_class,cut1,cut2,cut3,p_HE,ME
+from cut_optimisation import scan_weights,threshold_scan,grid_scan,best_cut
+from event_store import store_path,store_to_df
+from sample_meta import load_meta,signal_events
+from histograms import edges,fill1d
 
-#load data
+#load data (from the columnar store if the pickle has already been converted with event_store.py) together with the metadata sidecar of the sample (see sample_meta.py)
 path_df = Path('/home/skeilbach/FCCee_topEWK')
-df_lephad = pd.read_pickle(path_df/"wzp6_ee_SM_tt_tlepThad_noCKMmix_keepPolInfo_ecm365.pkl").sample(n=100000,ignore_index=True)
-df_hadlep = pd.read_pickle(path_df/"wzp6_ee_SM_tt_thadTlep_noCKMmix_keepPolInfo_ecm365.pkl").sample(n=100000,ignore_index=True)
-df_hadhad = pd.read_pickle(path_df/"wzp6_ee_SM_tt_thadThad_noCKMmix_keepPolInfo_ecm365.pkl").sample(n=100000,ignore_index=True)
+def load(filename):
+    sample_file = store_path(path_df/filename) if store_path(path_df/filename).is_dir() else path_df/filename
+    if sample_file.is_dir():
+        df = store_to_df(sample_file)
+    else:
+        df = pd.read_pickle(sample_file)
+    df["genW_leptons"] = truth_class(df) #truth labels are computed once here, events() then only counts them
+    return df,load_meta(sample_file,df["genW_leptons"].to_numpy())
+
+df_lephad,meta_lephad = load("wzp6_ee_SM_tt_tlepThad_noCKMmix_keepPolInfo_ecm365.pkl")
+df_hadlep,meta_hadlep = load("wzp6_ee_SM_tt_thadTlep_noCKMmix_keepPolInfo_ecm365.pkl")
+df_hadhad,meta_hadhad = load("wzp6_ee_SM_tt_thadThad_noCKMmix_keepPolInfo_ecm365.pkl")
 jet_algo = "kt_exactly6"
 
 #Scaling for each df 
@@ -23,82 +36,80 @@ N_exp_hadlep = N_expect["wzp6_ee_SM_tt_thadTlep_noCKMmix_keepPolInfo_ecm365"]
 N_exp_hadhad = N_expect["wzp6_ee_SM_tt_thadThad_noCKMmix_keepPolInfo_ecm365"]
 
 
-N_lephad = events(df_lephad,1)
-N_hadlep = events(df_hadlep,1)
-N_hadhad = events(df_hadhad,0)
+N_lephad = signal_events(meta_lephad,1)
+N_hadlep = signal_events(meta_hadlep,1)
+N_hadhad = signal_events(meta_hadhad,0)
 
 R_lephad = N_exp_lephad/N_lephad
 R_hadlep = N_exp_hadlep/N_hadlep
 R_hadhad = N_exp_hadhad/N_hadhad
 
 #apply isolation/leading cut and sanity cut first. They are to be untouched
-df_lephad = cut1(df_lephad,jet_algo)
-df_hadlep = cut1(df_hadlep,jet_algo)
-df_hadhad = cut1(df_hadhad,jet_algo)
+df_lephad = cut1(df_lephad,jet_algo=jet_algo)
+df_hadlep = cut1(df_hadlep,jet_algo=jet_algo)
+df_hadhad = cut1(df_hadhad,jet_algo=jet_algo)
 df_lephad = cut2(df_lephad)
 df_hadlep = cut2(df_hadlep)
 df_hadhad = cut2(df_hadhad)
-df_lephad = cut5(df_lephad,23)
-df_hadlep = cut5(df_hadlep,23)
-df_hadhad = cut5(df_hadhad,23)
 
 ###
-#Cut Optimisation (Use 100k entries per decay channel)
+#Joint cut optimisation of cut3/cut4/cut5 on a grid (the cut variables are only binned once, see cut_optimisation.py)
 ###
 
-#First Cut -> Compare eff and pur for cut4/cut5 and choose the cut with the best ratio of eff and pur. Cut6 is dealt with seperately/at the end because it is dependent on the lower momentum cut of cut4
+cut_grid = {"ME_cut": np.arange(0,50,1),
+            "p_cut": np.arange(0,50,1),
+            "d0": np.linspace(0.01,0.2,20),
+            "d0_signif": np.linspace(5,100,20)
+           }
+grid_result = grid_scan([(df_lephad,scan_weights(df_lephad,R_lephad,1)),(df_hadlep,scan_weights(df_hadlep,R_hadlep,1))],[(df_hadhad,scan_weights(df_hadhad,R_hadhad,0))],cut_grid)
+grid_result["best"] = best_cut(grid_result)
+print("---Best cut limits w.r.t. epsilon*pi: {}---".format(grid_result["best"]))
+path_grid = Path("/home/skeilbach/FCCee_topEWK/arrays/cut_opt")
+path_grid.mkdir(parents=True, exist_ok=True)
+with open(path_grid/'cut_grid.pkl', 'wb') as f:
+    pickle.dump(grid_result, f)
+
+df_lephad = cut3(df_lephad,ME_cut=23)
+df_hadlep = cut3(df_hadlep,ME_cut=23)
+df_hadhad = cut3(df_hadhad,ME_cut=23)
+
+###
+#Cut Optimisation (full samples, all thresholds are evaluated in one pass over the sorted cut variable)
+###
+
+#First Cut -> Compare eff and pur for cut3/cut4 and choose the cut with the best ratio of eff and pur. The cut variable is calculated once per event by the function given here
 cuts = {
-	#"cut4_<":cut4, #upper cut on p_leading lepton
-	"cut4_>":cut4, #lower cut on p_leading lepton
-	#"cut5":cut5
+	#"cut4_<":p_HE, #upper cut on p_leading lepton
+	"cut4_>":p_HE, #lower cut on p_leading lepton
+	#"cut3":ME
 	}
 
 cut_var = {
 	   #"cut4_<": np.arange(5,131,1),
 	   "cut4_>": np.arange(0,51,1),
-	   #"cut5": np.arange(0,71,1)
+	   #"cut3": np.arange(0,71,1)
 	   }
 
 cut_title = {
 	     #"cut4_<": ["Upper cut on highest energy lepton","Highest energy lepton","Momentum in GeV"],
   	     "cut4_>": ["Lower cut on highest energy lepton","Highest energy lepton","Momentum in GeV"],
-	     "cut5": ["Lower cut on Missing energy","Missing energy","ME in GeV"]
+	     "cut3": ["Lower cut on Missing energy","Missing energy","ME in GeV"]
 	    }
 
-#define function to return number of events before cuts (n) and after the cut has been applied (k). Decay_channel hereby refers to the amount of leptons originating from a W or top, i.e. 1=semileptonic and 0=allhadronic decay channel
-def df_cut(df_before_cut,df_after_cut,R_scaling,decay_channel):
-    n = R_scaling*events(df_before_cut,decay_channel)
-    k = R_scaling*events(df_after_cut,decay_channel)
-    return n,k
-
 path_save = Path("/home/skeilbach/FCCee_topEWK/arrays/cut_opt")
 path_save.mkdir(parents=True, exist_ok=True)
 
 for cut_name in cuts:
     cut_result = {}
-    eff,pur = [],[] #eff and purity are only calculated with respect to the semileptonic signal as the event selection aims to enrich the sample with semileptonic signal and discard allhadronic signal
     var = cut_var[cut_name]
     cut_result[cut_name] = var
-    if cut_name=="cut5":
-        for i in range(len(var)):
-            n_lephad,k_lephad = df_cut(df_lephad,cuts[cut_name](df_lephad,var[i]),R_lephad,1)
-            n_hadlep,k_hadlep = df_cut(df_hadlep,cuts[cut_name](df_hadlep,var[i]),R_hadlep,1)
-            n_hadhad,k_hadhad = df_cut(df_hadhad,cuts[cut_name](df_hadhad,var[i]),R_hadhad,0)
-            n_s = n_lephad + n_hadlep
-            k_s,k_b = k_lephad + k_hadlep, k_hadhad
-            eff.append(np.round(k_s/n_s,3))
-            pur.append(np.round(k_s/(k_s+k_b),3))
-    else:
-        for i in range(len(var)):
-            n_lephad,k_lephad = df_cut(df_lephad,cuts[cut_name](df_lephad,var[i],cut_name[-1]),R_lephad,1)
-            n_hadlep,k_hadlep = df_cut(df_hadlep,cuts[cut_name](df_hadlep,var[i],cut_name[-1]),R_hadlep,1)
-            n_hadhad,k_hadhad = df_cut(df_hadhad,cuts[cut_name](df_hadhad,var[i],cut_name[-1]),R_hadhad,0)
-            n_s = n_lephad + n_hadlep
-            k_s,k_b = k_lephad + k_hadlep, k_hadhad
-            eff.append(np.round(k_s/n_s,3))
-            pur.append(np.round(k_s/(k_s+k_b),3))
-    cut_result["epsilon"] = np.array(eff)
-    cut_result["pi"] = np.array(pur)
+    comparison = "<" if cut_name=="cut4_<" else ">"
+    #eff and purity are only calculated with respect to the semileptonic signal as the event selection aims to enrich the sample with semileptonic signal and discard allhadronic signal
+    signal = [(cuts[cut_name](df_lephad),scan_weights(df_lephad,R_lephad,1)),(cuts[cut_name](df_hadlep),scan_weights(df_hadlep,R_hadlep,1))]
+    background = [(cuts[cut_name](df_hadhad),scan_weights(df_hadhad,R_hadhad,0))]
+    eff,pur = threshold_scan(signal,background,var,comparison)
+    cut_result["epsilon"] = np.round(eff,3)
+    cut_result["pi"] = np.round(pur,3)
     with open(path_save/'{}.pkl'.format(cut_name), 'wb') as f:
         pickle.dump(cut_result, f)
 
@@ -106,31 +117,18 @@ for cut_name in cuts:
 #Plot the results 
 ###
 
-def calc_p(px,py,pz):
-    index = px.index
-    px,py,pz = ak.Array(px),ak.Array(py),ak.Array(pz)
-    p = np.sqrt(px**2+py**2+pz**2)
-    return pd.Series(data=p.to_list(),index=index)  
-
 #Define custom colours
 kit_green100=(0,.59,.51)
 kit_green50 =(.50,.79,.75)
 
 #Define optimise cut limits
 cut_lim = {#"cut4_>": [18,0.963,0.907], #[cut_lim,epsilon value, pi value]
-	   "cut5": [23,0.982,0.926]
+	   "cut3": [23,0.982,0.926]
           }
 
 #Define function that calculates momentum/ME based on cut_name for a df
 def df_array(df,cut_name):
-    if cut_name[:-2]=="cut4":
-        p_electron = calc_p(df["electron_px"],df["electron_py"],df["electron_pz"])
-        p_muon = calc_p(df["muon_px"],df["muon_py"],df["muon_pz"])
-        p_lepton = p_electron+p_muon
-        p_HE = p_lepton.apply(lambda row: ak.max(row))
-        return np.array(p_HE)
-    elif cut_name=="cut5":
-        return np.array(ak.flatten(df["Emiss_energy"]))
+    return cuts[cut_name](df)
 
 #Plot results for all cuts
 for cut_name in cuts:
@@ -146,9 +144,11 @@ for cut_name in cuts:
     ax1.set_title(cut_title[cut_name][0])
     #plot the distribution of the cut variable (e.g. momentum/ME) before the cuts
     array_lephad, array_hadlep, array_hadhad = df_array(df_lephad,cut_name),df_array(df_hadlep,cut_name),df_array(df_hadhad,cut_name)
-    counts_lephad, bin_edges = np.histogram(array_lephad,weights=np.full_like(array_lephad,R_lephad),bins=len(cut_result[cut_name]))
-    counts_hadlep,_ = np.histogram(array_hadlep,weights=np.full_like(array_hadlep,R_hadlep),bins=bin_edges)
-    counts_hadhad,_ = np.histogram(array_hadhad,weights=np.full_like(array_hadhad,R_hadhad),bins=bin_edges)
+    axis = (len(cut_result[cut_name]),np.min(array_lephad),np.max(array_lephad)) #same binning as np.histogram(array_lephad,bins=len(cut_result[cut_name]))
+    bin_edges = edges(axis)
+    counts_lephad = fill1d(array_lephad,axis,R_lephad)
+    counts_hadlep = fill1d(array_hadlep,axis,R_hadlep)
+    counts_hadhad = fill1d(array_hadhad,axis,R_hadhad)
     #save counts
     np.save(path_save/"counts_SL_{}".format(cut_name),counts_hadlep+counts_lephad)
     np.save(path_save/"counts_AH_{}".format(cut_name),counts_hadhad)
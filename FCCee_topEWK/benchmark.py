@@ -0,0 +1,78 @@
+import sys
+import io
+import time
+import pickle
+import contextlib
+from argparse import ArgumentParser
+from tabulate import tabulate
+from synthetic_events import synthetic_events
+from cut_flow_functions import cut1,cut2,cut4,cut5,df_filter,events,calc_p,lxcosTheta,LxcosTheta,cut_flow,truth_class,to_ak,to_events,cut1_mask,cut2_mask,cut3_mask,cut4_mask,cut5_mask
+
+'''
+Benchmark of the cut-flow hot paths on synthetic events (see synthetic_events.py), e.g.
+    python benchmark.py --n_events 10000 100000 1000000 --output bench.pkl
+Every function is timed on the same input for each sample size and the throughput in events/s (with respect to the number of events the function gets as input, n_input) is reported. The results can be pickled to track the performance over time
+'''
+
+jet_algo = "kt_exactly6"
+
+cut_dic = {"cut1": cut1_mask,"cut2": cut2_mask,"cut3": cut3_mask,"cut4": cut4_mask,"cut5": cut5_mask}
+cut_limits = {"cut1": {"jet_algo":jet_algo},
+              "cut2": {},
+              "cut3": {"ME_cut":23},
+              "cut4": {"p_cut":13,"comparison": ">"},
+              "cut5": {"d0":0.1,"d0_signif": 50, "p_cut":13}
+             }
+
+#time func(), the cut printouts are suppressed. Returns the best wall time out of repeat runs
+def timeit(func,repeat):
+    times = []
+    for i in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter()-start)
+    return min(times)
+
+def benchmarks(n_events,seed):
+    df = synthetic_events(n_events,"tlepThad",jet_algo,seed)
+    df["genW_leptons"] = truth_class(df)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_cut1 = cut1(df,jet_algo=jet_algo)
+        df_cut2 = cut2(df_cut1)
+        df_events = to_events(df)
+        df_final,_ = cut_flow(df_events,cut_dic,cut_limits,"tlepThad",1.)
+    mask_d0 = to_ak(df_cut2["electron_d0"]) < 0.1
+    #(function,number of input events), the throughput is given with respect to the events each function actually processes
+    return {"cut1": (lambda: cut1(df,jet_algo=jet_algo),len(df)),
+            "cut4": (lambda: cut4(df_cut2,**cut_limits["cut4"]),len(df_cut2)),
+            "cut5": (lambda: cut5(df_cut2,**cut_limits["cut5"]),len(df_cut2)),
+            "df_filter": (lambda: df_filter(df_cut2,mask_d0,"electron","cut5"),len(df_cut2)),
+            "events": (lambda: events(df,1),len(df)),
+            "truth_class": (lambda: truth_class(df),len(df)),
+            "calc_p": (lambda: calc_p(df["electron_px"],df["electron_py"],df["electron_pz"]),len(df)),
+            "lxcosTheta": (lambda: lxcosTheta(df_final),len(df_final)),
+            "LxcosTheta": (lambda: LxcosTheta(df),len(df)),
+            "cut_flow (mask cuts)": (lambda: cut_flow(df_events,cut_dic,cut_limits,"tlepThad",1.),len(df_events)),
+           }
+
+def run(n_events_list,repeat=1,seed=42):
+    table = []
+    for n_events in n_events_list:
+        for name,(func,n_input) in benchmarks(n_events,seed).items():
+            wall_time = timeit(func,repeat)
+            table.append({"function": name,"n_events": n_events,"n_input": n_input,"wall time [s]": wall_time,"events/s": n_input/wall_time})
+    return table
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the cut-flow functions on synthetic events")
+    parser.add_argument("--n_events",type=int,nargs="+",default=[10000,100000,1000000])
+    parser.add_argument("--repeat",type=int,default=1)
+    parser.add_argument("--seed",type=int,default=42)
+    parser.add_argument("--output",default=None,help="pickle the results to this file")
+    args = parser.parse_args()
+    table = run(args.n_events,args.repeat,args.seed)
+    print(tabulate(table,headers="keys",tablefmt="grid"))
+    if args.output is not None:
+        with open(args.output,"wb") as f:
+            pickle.dump({"time": time.strftime("%Y-%m-%d %H:%M:%S"),"python": sys.version,"results": table},f)
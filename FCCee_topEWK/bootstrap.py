@@ -0,0 +1,37 @@
+import json
+import zlib
+import numpy as np
+
+'''
+Poisson bootstrap of the cut-flow efficiencies and purities. Every signal event of a sample gets an independent Poisson(1) weight in each of n_replicas replicas and the whole cut-flow table is recomputed for all replicas at once from the per-event cut-pass bitmask (bit i: the event survived cuts 1..i+1, see cut_flow(...,bits=...)):
+    table[b,i] = R*sum_e w[b,e]*bit_i(e)
+i.e. one (n_replicas,chunk) weight array times the (chunk,n_cuts) pass matrix per chunk of events. The same weights enter all cuts of an event, so the correlations between the cuts are kept, and the replica tables are scaled with R_channel before the channels are combined. The spread of the efficiencies/purities over the replicas complements the analytic eff_std/pur_std of signal_eff_pur
+'''
+
+#independent random stream for each sample (and the same stream on every run), e.g. replica_rng(42,"ta_ttAdown_","tlepThad")
+def replica_rng(seed,*key):
+    return np.random.default_rng([seed,zlib.crc32(json.dumps(key).encode())])
+
+#(n_events,n_cuts) 0/1 matrix from the bitmask
+def cut_pass(cut_bits,n_cuts):
+    return ((cut_bits[:,None] >> np.arange(n_cuts,dtype=cut_bits.dtype)) & 1).astype(np.float32)
+
+#unnormalised cut-flow tables (n_replicas,n_cuts) of the signal events with the given bitmask. The weights are drawn for chunk_size events at a time ((n_replicas,chunk_size) array), the tables of the chunks (or of the chunks of a streamed sample) can be added
+def replica_tables(cut_bits,n_cuts,n_replicas,rng,chunk_size=10000):
+    cut_bits = cut_bits[cut_bits!=0] #events that failed all cuts do not enter the table
+    tables = np.zeros((n_replicas,n_cuts))
+    for start in range(0,len(cut_bits),chunk_size):
+        passed = cut_pass(cut_bits[start:start+chunk_size],n_cuts)
+        weights = rng.poisson(1.,size=(n_replicas,len(passed))).astype(np.float32)
+        tables += weights@passed
+    return tables
+
+#replicas: {channel: replica tables times R_channel}. Returns the bootstrap std of the efficiency (relative to the first cut, as in signal_eff_pur) and purity of the semileptonic and allhadronic signal after each cut together with the correlation matrices of the efficiencies between the cuts
+def bootstrap_eff_pur(**replicas):
+    k_SL,k_AH = replicas["tlepThad"]+replicas["thadTlep"],replicas["thadThad"]
+    with np.errstate(divide="ignore",invalid="ignore"):
+        eff_SL,eff_AH = k_SL/k_SL[:,:1],k_AH/k_AH[:,:1]
+        pur_SL,pur_AH = k_SL/(k_SL+k_AH),k_AH/(k_SL+k_AH)
+        result = {name: np.std(values,axis=0,ddof=1) for name,values in [("eff_SL",eff_SL),("eff_AH",eff_AH),("pur_SL",pur_SL),("pur_AH",pur_AH)]}
+        result["corr_eff_SL"],result["corr_eff_AH"] = np.corrcoef(eff_SL[:,1:],rowvar=False),np.corrcoef(eff_AH[:,1:],rowvar=False)
+    return result
@@ -0,0 +1,50 @@
+import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from iminuit import Minuit
+
+'''
+Binned chi2 fit of the (x,cosTheta) distributions for all BSM couplings at once. The histograms of the couplings (see sample_norms.xsec_variation) are stacked into one (n_couplings,625) array n_mod and the fit parameter k interpolates linearly between the SM and the modified coupling:
+    chi2(k) = sum_i (n_i-(n_SM+k*(n_mod-n_SM)))**2/n_i = a*k**2-2*b*k+c
+with a = sum_i (n_mod-n_SM)**2/n_i, b = sum_i (n_mod-n_SM)*(n_i-n_SM)/n_i and c = sum_i (n_i-n_SM)**2/n_i per coupling (empty bins n_i=0 are left out). chi2, its gradient, the minimum k_min = b/a, the uncertainty k_std = 1/sqrt(a) (Delta chi2 = 1) and the Delta chi2 profile are evaluated for all couplings in one call from (a,b,c). The Minuit fits are run in parallel on top of that as a cross-check and for the m.profile scans
+'''
+
+#n_i, n_SM and n_mod are broadcast against each other, e.g. n_i = n_SM of shape (625,) against n_mod of shape (n_couplings,625) gives one (a,b,c) per coupling
+def coefficients(n_i,n_SM,n_mod):
+    n_i,n_SM,n_mod = np.broadcast_arrays(n_i,n_SM,n_mod)
+    w = np.divide(1.,n_i,out=np.zeros(np.shape(n_i)),where=np.asarray(n_i)>0)
+    delta,residual = n_mod-n_SM,n_i-n_SM
+    return np.sum(w*delta**2,axis=-1),np.sum(w*delta*residual,axis=-1),np.sum(w*residual**2,axis=-1)
+
+#k has one value per coupling (shape (n_couplings,)) or a grid per coupling (shape (n_couplings,n_k))
+def chi2(k,a,b,c):
+    a,b,c = [np.reshape(coeff,np.shape(coeff)+(1,)*(np.ndim(k)-np.ndim(coeff))) for coeff in (a,b,c)]
+    return a*k**2-2*b*k+c
+
+def chi2_grad(k,a,b,c):
+    a,b = [np.reshape(coeff,np.shape(coeff)+(1,)*(np.ndim(k)-np.ndim(coeff))) for coeff in (a,b)]
+    return 2*(a*k-b)
+
+def fit_analytic(a,b,c):
+    k_min = b/a
+    return {"k_min": k_min,"k_std": 1/np.sqrt(a),"chi2_min": chi2(k_min,a,b,c)}
+
+#Delta chi2 for all couplings on a common grid of k values, shape (n_couplings,n_k)
+def profile_scan(k,a,b,c):
+    k = np.broadcast_to(k,np.shape(a)+np.shape(k))
+    return chi2(k,a,b,c)-fit_analytic(a,b,c)["chi2_min"][...,None]
+
+#migrad fit + Delta chi2 profile of one coupling (a,b,c are scalars)
+def minuit_fit(a,b,c,size=100,bound=2):
+    m = Minuit(lambda k: chi2(k,a,b,c),grad=lambda k: [chi2_grad(k,a,b,c)],k=0)
+    m.errordef = Minuit.LEAST_SQUARES
+    m.migrad()
+    k_profile,Delta_chi2 = m.profile("k",size=size,bound=bound,subtract_min=True)
+    return {"k_min": m.values["k"],"k_std": m.errors["k"],"chi2_min": m.fval,"valid": m.valid,"k_profile": k_profile,"Delta_chi2": Delta_chi2}
+
+#Minuit fits of all couplings in parallel, returns {BSM_coupling: minuit_fit(...)}
+def fit_parallel(n_i,n_SM,n_mod,BSM_mod,n_workers=None):
+    a,b,c = coefficients(n_i,n_SM,n_mod)
+    with ProcessPoolExecutor(max_workers=n_workers,mp_context=multiprocessing.get_context("fork")) as pool:
+        fits = pool.map(minuit_fit,a,b,c)
+        return dict(zip(BSM_mod,fits))
@@ -0,0 +1,66 @@
+import json
+import inspect
+import hashlib
+import numpy as np
+import awkward as ak
+from pathlib import Path
+from sample_meta import file_stat
+
+'''
+Content-addressed cache for the mask cut chain (see cut_flow(...,cache=...)). After each cut the masks (event mask, per-lepton masks, cut2 masks, cut-pass bitmask) and the unnormalised numbers of signal events after cuts 1..i are stored in <cache_dir>/<key>.npz. The key of the i-th cut is a hash of
+    - the sample (file name, size and modification time of the pickle or the columnar store, chunk position in streaming mode)
+    - channel and BSM coupling
+    - name, limits and source file of cuts 1..i of cut_dic
+i.e. every prefix of the cut chain has its own entry. Changing the limits of cut5 only invalidates the cut5 entry, the chain is resumed from the cached masks after cut4. Editing the cut functions invalidates all entries, old entries are never deleted automatically
+'''
+
+def sample_signature(sample_file):
+    return {"file": Path(sample_file).name,**file_stat(sample_file)}
+
+def source_hash(func):
+    return hashlib.sha256(Path(inspect.getsourcefile(func)).read_bytes()).hexdigest()
+
+#one cache file per prefix of cut_dic, part identifies the chunk in streaming mode (e.g. (start,chunk_size))
+def prefix_paths(cache_dir,sample_file,channel,BSM_coupling,cut_dic,cut_limits_dic,part=None):
+    config = {"sample": sample_signature(sample_file),"channel": channel,"BSM_coupling": BSM_coupling,"part": part,"cuts": []}
+    paths = []
+    for cut_name in cut_dic:
+        config["cuts"].append([cut_name,cut_dic[cut_name].__name__,cut_limits_dic[cut_name],source_hash(cut_dic[cut_name])])
+        key = hashlib.sha256(json.dumps(config,sort_keys=True,default=str).encode()).hexdigest()
+        paths.append(Path(cache_dir)/"{}.npz".format(key))
+    return paths
+
+def save_masks(path,masks,table_s):
+    arrays = {"table_s": np.asarray(table_s)}
+    for name,mask in masks.items():
+        if isinstance(mask,ak.Array) and mask.ndim > 1:
+            arrays["{}.content".format(name)] = ak.to_numpy(ak.flatten(mask))
+            arrays["{}.counts".format(name)] = ak.to_numpy(ak.num(mask,axis=1))
+        else:
+            arrays[name] = np.asarray(mask)
+    path.parent.mkdir(parents=True,exist_ok=True)
+    #write to a temporary file first so that parallel workers never read half written entries
+    tmp_path = path.with_name(path.name+".tmp")
+    with open(tmp_path,"wb") as f:
+        np.savez(f,**arrays)
+    tmp_path.replace(path)
+
+def load_masks(path):
+    masks = {}
+    with np.load(path) as f:
+        table_s = list(f["table_s"])
+        for name in f.files:
+            if name.endswith(".content"):
+                name = name[:-len(".content")]
+                masks[name] = ak.unflatten(f["{}.content".format(name)],f["{}.counts".format(name)])
+            elif name != "table_s" and not name.endswith(".counts"):
+                masks[name] = f[name]
+    return masks,table_s
+
+#index of the first cut that has to be evaluated (0: nothing cached) plus the masks and signal counts after the longest cached prefix
+def resume(paths):
+    for i in range(len(paths),0,-1):
+        if paths[i-1].exists():
+            masks,table_s = load_masks(paths[i-1])
+            return i,masks,table_s
+    return 0,None,[]
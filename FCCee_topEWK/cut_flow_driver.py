@@ -0,0 +1,90 @@
+import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cut_flow_functions import events_load,df_load_chunks,cut_flow,lxcosTheta,sample_file,sample_R,required_branches
+from cut_cache import prefix_paths
+from profiling import merge_profiles
+from histograms import x_axis,cosTheta_axis,fill2d,n_outside,empty2d
+from response import response,response_branches
+from bootstrap import replica_rng,replica_tables
+
+'''
+Parallel driver for the analysis: every (BSM coupling, decay channel) combination is loaded, cut and histogrammed in its own worker process. The workers only return the (x,cosTheta) histograms and the cut-flow table, the dfs never leave the worker
+'''
+
+#(x,cosTheta) histograms of the positive and negative leptons and the number of leptons outside the axes (lplus,lminus), e.g. with x > 1, which are not in the histograms
+def xcosTheta_hist(df,R):
+    if len(df)==0:
+        return empty2d(x_axis,cosTheta_axis),empty2d(x_axis,cosTheta_axis),np.zeros(2)
+    x_lplus,x_lminus,Theta_lplus,Theta_lminus = lxcosTheta(df)
+    counts_lplus = fill2d(x_lplus,np.cos(Theta_lplus),x_axis,cosTheta_axis,R)
+    counts_lminus = fill2d(x_lminus,np.cos(Theta_lminus),x_axis,cosTheta_axis,R)
+    outside = np.array([n_outside(x_lplus,np.cos(Theta_lplus),x_axis,cosTheta_axis,R),n_outside(x_lminus,np.cos(Theta_lminus),x_axis,cosTheta_axis,R)])
+    return counts_lplus,counts_lminus,outside
+
+def report_outside(channel,BSM_coupling,outside):
+    if np.sum(outside)>0:
+        print("---WARNING: {} {}: {:.4g} lepton(s) outside the (x,cosTheta) axes are not in the histograms---".format(channel,BSM_coupling if BSM_coupling!="" else "SM",np.sum(outside)))
+
+#streaming version of df_load+cut_flow+histogramming: the sample is pushed through the cut chain in chunks of chunk_size events and the event counts/histograms are accumulated unnormalised. They are scaled with R = N_exp/N_df (from the metadata sidecar of the sample, see sample_R) at the end, i.e. the peak memory is set by chunk_size and not by the sample size
+def cut_flow_streaming(channel,BSM_coupling,cut_dic,cut_limits,chunk_size,profile=None,cache_dir=None,with_response=False,n_bootstrap=None,seed=42):
+    table_s,counts_lplus,counts_lminus,outside,profiles,responses,replicas = 0,0,0,np.zeros(2),[],[],0
+    rng = replica_rng(seed,BSM_coupling,channel)
+    for i,df_chunk in enumerate(df_load_chunks(channel,BSM_coupling,chunk_size,load_branches(cut_dic,cut_limits,with_response))):
+        profiles.append([] if profile is not None else None)
+        cache = prefix_paths(cache_dir,sample_file(channel,BSM_coupling),channel,BSM_coupling,cut_dic,cut_limits,(i*chunk_size,chunk_size)) if cache_dir is not None else None
+        bits = {} if n_bootstrap is not None else None
+        df_cut,table_chunk = cut_flow(df_chunk,cut_dic,cut_limits,channel,1,profiles[-1],cache,bits)
+        if n_bootstrap is not None:
+            replicas = replicas+replica_tables(bits["cut_bits"],len(cut_dic),n_bootstrap,rng)
+        counts_lplus_chunk,counts_lminus_chunk,outside_chunk = xcosTheta_hist(df_cut,1)
+        table_s,counts_lplus,counts_lminus,outside = table_s+table_chunk,counts_lplus+counts_lplus_chunk,counts_lminus+counts_lminus_chunk,outside+outside_chunk
+        if with_response:
+            responses.append(response(df_chunk,df_cut))
+    if profile is not None:
+        profile.extend(merge_profiles(profiles,cut_dic))
+    R_channel = sample_R(channel,BSM_coupling)
+    result = {"counts_lplus": R_channel*counts_lplus,"counts_lminus": R_channel*counts_lminus,"outside": R_channel*outside,"table": R_channel*table_s,"R": R_channel}
+    if with_response:
+        result["response"] = {charge: {key: R_channel*sum(chunk[charge][key] for chunk in responses) for key in responses[0][charge]} for charge in responses[0]}
+    if n_bootstrap is not None:
+        result["replicas"] = R_channel*replicas
+    return result
+
+#branches to load: the branches of the cut chain plus the reco/gen lepton branches for the response matrix (None: all branches)
+def load_branches(cut_dic,cut_limits,with_response=False):
+    columns = required_branches(cut_dic,cut_limits)
+    return sorted(set(columns)|set(response_branches)) if (columns is not None and with_response) else columns
+
+#chunk_size=None processes the whole sample at once. With profile=True the per-cut profile (see profiling.py) is returned as well, with with_response=True the reco-gen migration matrices (see response.py) and with n_bootstrap the (n_bootstrap,n_cuts) Poisson bootstrap replicas of the cut-flow table (see bootstrap.py). With a cache_dir the masks after each cut are cached and only the cuts whose limits (or the limits of a cut before them) changed are evaluated again (see cut_cache.py)
+def process_channel(BSM_coupling,channel,cut_dic,cut_limits,chunk_size=None,profile=False,cache_dir=None,with_response=False,n_bootstrap=None,seed=42):
+    cut_profile = [] if profile else None
+    if chunk_size is not None:
+        result = cut_flow_streaming(channel,BSM_coupling,cut_dic,cut_limits,chunk_size,cut_profile,cache_dir,with_response,n_bootstrap,seed)
+    else:
+        df_channel,R_channel = events_load(channel,BSM_coupling,load_branches(cut_dic,cut_limits,with_response))
+        cache = prefix_paths(cache_dir,sample_file(channel,BSM_coupling),channel,BSM_coupling,cut_dic,cut_limits) if cache_dir is not None else None
+        bits = {} if n_bootstrap is not None else None
+        df_cut,table_df = cut_flow(df_channel,cut_dic,cut_limits,channel,R_channel,cut_profile,cache,bits)
+        counts_lplus,counts_lminus,outside = xcosTheta_hist(df_cut,R_channel)
+        result = {"counts_lplus": counts_lplus,"counts_lminus": counts_lminus,"outside": outside,"table": table_df,"R": R_channel}
+        if with_response:
+            result["response"] = response(df_channel,df_cut,R_channel)
+        if n_bootstrap is not None:
+            result["replicas"] = R_channel*replica_tables(bits["cut_bits"],len(cut_dic),n_bootstrap,replica_rng(seed,BSM_coupling,channel))
+    if profile:
+        result["profile"] = cut_profile
+    report_outside(channel,BSM_coupling,result["outside"])
+    return BSM_coupling,channel,result
+
+#returns {BSM_coupling: {channel: {"counts_lplus":...,"counts_lminus":...,"outside":...,"table":...,"R":...(,"profile":...,"response":...,"replicas":...)}}}. n_workers=None uses all cores. The workers are forked so that the analysis scripts do not need a __main__ guard
+def run_parallel(BSM_mod,ntuples,cut_dic,cut_limits,n_workers=None,chunk_size=None,profile=False,cache_dir=None,with_response=False,n_bootstrap=None,seed=42):
+    results = {BSM_coupling: {} for BSM_coupling in BSM_mod}
+    with ProcessPoolExecutor(max_workers=n_workers,mp_context=multiprocessing.get_context("fork")) as pool:
+        jobs = [pool.submit(process_channel,BSM_coupling,channel,cut_dic,cut_limits,chunk_size,profile,cache_dir,with_response,n_bootstrap,seed) for BSM_coupling in BSM_mod for channel in ntuples]
+        for job in as_completed(jobs):
+            BSM_coupling,channel,result = job.result()
+            print("---Finished {} {}---".format(channel,BSM_coupling if BSM_coupling!="" else "SM"))
+            results[BSM_coupling][channel] = result
+    #keep the order of ntuples in the results
+    return {BSM_coupling: {channel: results[BSM_coupling][channel] for channel in ntuples} for BSM_coupling in BSM_mod}
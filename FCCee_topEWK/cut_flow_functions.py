@@ -4,8 +4,15 @@ import pandas as pd
 import awkward as ak
 from tabulate import tabulate
 from scipy import constants
-from itertools import compress
+from itertools import compress,chain
 from sample_norms import N_expect
+from event_store import store_path,store_to_df,load_store
+from profiling import snapshot,record
+from kinematics import theta,eta_to_theta
+from cut_cache import resume,save_masks
+from sample_meta import read_meta,write_meta,signal_events
+from bootstrap import bootstrap_eff_pur
+from pathlib import Path
 
 ###
 #Define cuts for cut-flow
@@ -18,17 +25,74 @@ def compress_col(df_col,mask):
     return tmp
 
 #Define df loader and Rescaling factor function
-def df_load(channel,BSM_mod):
-    filepath = "/ceph/skeilbach/FCCee_topEWK/wzp6_ee_SM_tt_{}_noCKMmix_keepPolInfo_{}ecm365.pkl".format(channel,BSM_mod)
-    df = pd.read_pickle(filepath)
-    N_exp = N_expect["wzp6_ee_SM_tt_{}_noCKMmix_keepPolInfo_{}ecm365".format(channel,BSM_mod)]
+def sample_name(channel,BSM_mod):
+    return "wzp6_ee_SM_tt_{}_noCKMmix_keepPolInfo_{}ecm365".format(channel,BSM_mod)
+
+def sample_path(channel,BSM_mod):
+    return "/ceph/skeilbach/FCCee_topEWK/{}.pkl".format(sample_name(channel,BSM_mod))
+
+#number of leptons originating from a W or t in the signal events of the decay channel, i.e. 1=semileptonic and 0=allhadronic
+def W_leptons(channel):
     if (channel=="tlepThad")|(channel=="thadTlep"):
-        N_df = events(df,1)
+        return 1
+    elif (channel=="thadThad"):
+        return 0
+
+#file the loaders read: the columnar store if the pickle has been converted (see event_store.py), else the pickle
+def sample_file(channel,BSM_mod):
+    filepath = sample_path(channel,BSM_mod)
+    return store_path(filepath) if store_path(filepath).is_dir() else Path(filepath)
+
+#Rescaling factor R = N_exp/N_df. N_df is taken from the metadata sidecar of the sample (see sample_meta.py), genW_leptons of all events only has to be passed if it is already known. Without a valid sidecar only the genLepton parentPDG branches are read to build it
+def sample_R(channel,BSM_mod,genW_leptons=None):
+    meta = read_meta(sample_file(channel,BSM_mod))
+    if meta is None:
+        if genW_leptons is None:
+            columns = ["genElectron_parentPDG","genMuon_parentPDG"]
+            df = load_store(sample_file(channel,BSM_mod),columns) if sample_file(channel,BSM_mod).is_dir() else pd.read_pickle(sample_file(channel,BSM_mod))[columns]
+            genW_leptons = truth_class(df)
+        meta = write_meta(sample_file(channel,BSM_mod),genW_leptons)
+    N_exp = N_expect[sample_name(channel,BSM_mod)]
+    N_df = signal_events(meta,W_leptons(channel))
+    return N_exp/N_df
+
+#if the pickle has been converted to the columnar store (see event_store.py), only the branches listed in columns are read from it (all if columns=None)
+def df_load(channel,BSM_mod,columns=None):
+    filepath = sample_file(channel,BSM_mod)
+    if filepath.is_dir():
+        df = store_to_df(filepath,columns)
     else:
-        N_df = events(df,0)
-    R_df = N_exp/N_df
+        df = pd.read_pickle(filepath)
+        df = df[columns] if columns is not None else df
+    df["genW_leptons"] = truth_class(df)
+    R_df = sample_R(channel,BSM_mod,df["genW_leptons"].to_numpy())
     return df,R_df
 
+#same as df_load but returns the events as one awkward array (see to_events) which is read directly from the columnar store if available. The branches of the store are loaded lazily, pass columns=required_branches(cut_dic,cut_limits) to only convert the branches the cut chain needs if the sample is a pickle
+def events_load(channel,BSM_mod,columns=None):
+    filepath = sample_file(channel,BSM_mod)
+    if filepath.is_dir():
+        df_events = load_store(filepath,columns)
+    else:
+        df = pd.read_pickle(filepath)
+        df_events = to_events(df[columns] if columns is not None else df)
+    genW_leptons = truth_class(df_events)
+    df_events = ak.with_field(df_events,genW_leptons,"genW_leptons")
+    R_df = sample_R(channel,BSM_mod,genW_leptons)
+    return df_events,R_df
+
+#same as events_load but yields the sample in chunks of chunk_size events, R is taken from sample_R
+def df_load_chunks(channel,BSM_mod,chunk_size,columns=None):
+    filepath = sample_file(channel,BSM_mod)
+    if filepath.is_dir():
+        df_events = load_store(filepath,columns)
+    else:
+        df = pd.read_pickle(filepath) #pickles can not be read partially, convert them with event_store.py to bound the memory
+        df_events = to_events(df[columns] if columns is not None else df)
+    for start in range(0,len(df_events),chunk_size):
+        df_chunk = df_events[start:start+chunk_size]
+        yield ak.with_field(df_chunk,truth_class(df_chunk),"genW_leptons")
+
 '''
 Do not dabble with jet energies for now as kt_exactly6 jet algo is now being used where rejecting jets would hamper with later cut criteria, e.g. inverse W mass from two hadronic jet
 #jet energy cut: throw away jets with E<10 GeV, i.e. do not consider them as jets
@@ -55,123 +119,54 @@ def cut0(input_df,jet_algo):
     return df    
 '''
 
-#isolation/leading cut: Require lepton candidate to be isolated with dR>0.4 to all jets or leading particle if within a jet with E_l/E_jet > 0.5
-def phi(px,py):
-    tmp = []
-    for i in range(len(px)):
-        if (px[i]>0)&(py[i]>0):
-            tmp.append(np.arctan(py[i]/px[i]))
-        if (px[i]<0)&(py[i]>0):
-            tmp.append(np.arctan(py[i]/px[i])+np.pi)
-        if (px[i]<0)&(py[i]<0):
-            tmp.append(np.arctan(py[i]/px[i])+np.pi)
-        if (px[i]>0)&(py[i]<0):
-            tmp.append(np.arctan(py[i]/px[i])+2*np.pi)
-    return tmp
-
-def azim_angle(px,py):
-    output = []
-    for i,index in enumerate(px.index):
-        output.append(phi(px[index],py[index]))
-    return output
-
-#Theta not necessary to be calculated because eta (pseudorapidity) is already given as variable in df
-def theta(pt,pz):
-    theta = []
-    for i, val in enumerate(pt):
-        if pz[i]>0:
-                theta.append(np.arctan(pt[i]/pz[i]))
-        elif pz[i]<0:
-                theta.append(np.arctan(pt[i]/pz[i])+np.pi)
-    return theta
-
-def genTheta(pt,pz):
-    Theta = []
-    for i,index in enumerate(pt.index):
-       Theta.append(theta(pt[index],pz[index]))
-    return Theta
-
-def Theta(row):
-    tmp = []
-    if (len(row)!=0):
-        for i,eta in enumerate(row):
-            tmp.append(2*np.arctan(np.exp(-eta)))
-    return tmp
-
-def pseudorap(Theta):
-    tmp = []
-    for i, index in enumerate(Theta.index):
-        hlp = [];theta=Theta[index];
-        for j in range(len(theta)):
-            if theta[j]<= (np.pi/2):
-                hlp.append((-1)*np.log(np.tan(theta[j]/2)))
-            if theta[j] > (np.pi/2):
-                hlp.append(np.log(np.tan((np.pi-theta[j])/2)))
-        tmp.append(hlp)
-    return tmp
-
-def leading_lep(lepton_energy,jet_energy,dr_bool,ratio_lepjet):
-    tmp = []
-    lepjet = list(compress(jet_energy,dr_bool)) #all jets which overlap with a semileptonic candidate
-    if len(lepjet)==1:
-        return ((lepton_energy/lepjet[0])>ratio_lepjet)
-    elif len(lepjet)>1:
-        for i in range(len(lepjet)):
-            tmp.append((lepton_energy/lepjet[i])>ratio_lepjet)
-        return all(tmp) #only return true (i.e. the lepton is the leading particle inside a jet) if the lepton is leading in all jets with whom it overlaps
-    else:
-        return True
-
-def dR(phi_lepton,phi_jets,rap_lepton,rap_jets,jet_energy,lepton_energy,ratio_lepjet):
-    tmp = []
-    if len(phi_lepton)!=0:
-        for j in range(len(phi_lepton)):
-            dr_bool = []
-            for k in range(len(phi_jets)):
-                dr = np.sqrt((phi_lepton[j]-phi_jets[k])**2+(rap_lepton[j]-rap_jets[k])**2)
-                dr_bool.append(dr<0.4)
-            tmp.append(False|leading_lep(lepton_energy[j],jet_energy,dr_bool,ratio_lepjet))            
-    else:
-        tmp.append(False) #for empty entries [] automatically return False
-    return tmp
-
-
-
-def df_filter(input_df,mask,lepton_name,cut_name):
+def to_ak(df_col):
+    if isinstance(df_col,ak.Array):
+        return df_col
+    #build the jagged array from the row lengths and the flattened values directly (much faster than ak.Array(df_col.to_list()))
+    counts = np.fromiter(map(len,df_col),dtype=np.int64,count=len(df_col))
+    return ak.unflatten(np.array(list(chain.from_iterable(df_col))),counts)
+
+#isolation/leading cut: Require lepton candidate to be isolated with dR>0.4 to all jets or leading particle if within a jet with E_l/E_jet > 0.5. All lepton-jet pairs of all events are built at once (events x leptons x jets)
+def isolation_mask(phi_lepton,phi_jets,rap_lepton,rap_jets,jet_energy,lepton_energy,ratio_lepjet,dr_max=0.4):
+    lepton = ak.zip({"phi":phi_lepton,"rap":rap_lepton,"energy":lepton_energy})
+    jet = ak.zip({"phi":phi_jets,"rap":rap_jets,"energy":jet_energy})
+    pairs = ak.cartesian({"lepton":lepton,"jet":jet},axis=1,nested=True)
+    dr = np.sqrt((pairs.lepton.phi-pairs.jet.phi)**2+(pairs.lepton.rap-pairs.jet.rap)**2)
+    leading = (pairs.lepton.energy/pairs.jet.energy) > ratio_lepjet
+    #keep lepton if it is the leading particle in all jets it overlaps with (dR<0.4) -> ak.all of an empty list is True, i.e. isolated leptons are kept as well. Events without leptons get an empty mask
+    return ak.all(~(dr<dr_max) | leading, axis=2)
+
+
+lepton_vars = ["px","py","pz","phi","eta","theta","energy","charge","d0","d0signif"]
+
+#apply the per-lepton mask to all lepton branches at once by zipping them into one awkward record array
+#columns: {var: jagged array} of lepton variables that are not (yet) stored in the df, e.g. the theta computed in cut1
+#the mask is applied columnar, but the filtered branches still have to be written back to the df as one python list per row (to_list), which dominates the run time of the df cuts (cut1/cut5). The cut_flow with the mask cuts (cut1_mask,...) avoids these copies and only materialises the events once after the last cut
+def df_filter(input_df,mask,lepton_name,cut_name,columns=None):
+    columns = columns or {}
     df = input_df.copy()
-    lepton_px, lepton_py, lepton_pz, lepton_phi, lepton_eta, lepton_theta, lepton_energy,lepton_charge,lepton_d0,lepton_d0signif = df["{}_px".format(lepton_name)], df["{}_py".format(lepton_name)], df["{}_pz".format(lepton_name)], df["{}_phi".format(lepton_name)],df["{}_eta".format(lepton_name)],df["{}_theta".format(lepton_name)], df["{}_energy".format(lepton_name)],df["{}_charge".format(lepton_name)],df["{}_d0".format(lepton_name)],df["{}_d0signif".format(lepton_name)]
+    mask = ak.values_astype(ak.Array(mask) if len(df)!=0 else ak.Array([[]])[:0],bool) #keep the mask jagged for empty dfs
+    lepton = ak.zip({var: columns[var] if var in columns else to_ak(df["{}_{}".format(lepton_name,var)]) for var in lepton_vars})[mask]
     #save mask to df as column
-    df["{}_{}".format(cut_name,lepton_name)] = pd.Series(data=mask,index=df.index)
-    df["{}_energy".format(lepton_name)] = pd.Series(data=compress_col(lepton_energy,mask),index=df.index)
-    df["{}_px".format(lepton_name)] = pd.Series(data=compress_col(lepton_px,mask),index=df.index)
-    df["{}_py".format(lepton_name)] = pd.Series(data=compress_col(lepton_py,mask),index=df.index)
-    df["{}_pz".format(lepton_name)] = pd.Series(data=compress_col(lepton_pz,mask),index=df.index)
-    df["{}_phi".format(lepton_name)] = pd.Series(data=compress_col(lepton_phi,mask),index=df.index)
-    df["{}_eta".format(lepton_name)] = pd.Series(data=compress_col(lepton_eta,mask),index=df.index)
-    df["{}_theta".format(lepton_name)] = pd.Series(data=compress_col(lepton_theta,mask),index=df.index)
-    df["{}_charge".format(lepton_name)] = pd.Series(data=compress_col(lepton_charge,mask),index=df.index)
-    df["{}_d0".format(lepton_name)] = pd.Series(data=compress_col(lepton_d0,mask),index=df.index)
-    df["{}_d0signif".format(lepton_name)] = pd.Series(data=compress_col(lepton_d0signif,mask),index=df.index)
-    df["n_{}s".format(lepton_name)] = df["{}_{}".format(cut_name,lepton_name)].apply(lambda row: sum(row))
+    df["{}_{}".format(cut_name,lepton_name)] = pd.Series(data=mask.to_list(),index=df.index)
+    for var in lepton_vars:
+        df["{}_{}".format(lepton_name,var)] = pd.Series(data=lepton[var].to_list(),index=df.index)
+    df["n_{}s".format(lepton_name)] = pd.Series(data=ak.to_numpy(ak.sum(mask,axis=1)),index=df.index)
     return df
 
 def cut1(input_df,**kwargs):
     jet_algo = kwargs["jet_algo"]
     print("---Applying cut1: Require lepton candidate to be isolated from all jets with dR > 0.4 or being the leading particle within the jet---")
-    mask_electron,mask_muon = [],[]
     df = input_df.copy()
-    df["muon_theta"] = df["muon_eta"].apply(lambda row: Theta(row))
-    df["electron_theta"] = df["electron_eta"].apply(lambda row: Theta(row))
-    #save df columns as variables to make code more comprehensive  
-    phi_electron, rap_electron, electron_energy = df["electron_phi"],df["electron_eta"],df["electron_energy"]
-    phi_muon, rap_muon, muon_energy = df["muon_phi"],df["muon_eta"],df["muon_energy"]
-    phi_jet, rap_jet, jet_energy = df["jet_{}_phi".format(jet_algo)],df["jet_{}_eta".format(jet_algo)],df["jet_{}_energy".format(jet_algo)]
-    for i,index in enumerate(df.index):
-        mask_muon.append(dR(phi_muon[index],phi_jet[index],rap_muon[index],rap_jet[index],jet_energy[index],muon_energy[index],0.5))
-        mask_electron.append(dR(phi_electron[index],phi_jet[index],rap_electron[index],rap_jet[index],jet_energy[index],electron_energy[index],0.5))
-    #apply mask_electron/muon to df to throw away all leptons that do not fulfill the isolation/leading criteria prior to the cut-flow
-    df = df_filter(df,mask_electron,"electron","cut1")
-    df = df_filter(df,mask_muon,"muon","cut1")
+    #save df columns as awkward arrays to make code more comprehensive  
+    phi_electron, rap_electron, electron_energy = to_ak(df["electron_phi"]),to_ak(df["electron_eta"]),to_ak(df["electron_energy"])
+    phi_muon, rap_muon, muon_energy = to_ak(df["muon_phi"]),to_ak(df["muon_eta"]),to_ak(df["muon_energy"])
+    phi_jet, rap_jet, jet_energy = to_ak(df["jet_{}_phi".format(jet_algo)]),to_ak(df["jet_{}_eta".format(jet_algo)]),to_ak(df["jet_{}_energy".format(jet_algo)])
+    mask_muon = isolation_mask(phi_muon,phi_jet,rap_muon,rap_jet,jet_energy,muon_energy,0.5)
+    mask_electron = isolation_mask(phi_electron,phi_jet,rap_electron,rap_jet,jet_energy,electron_energy,0.5)
+    #apply mask_electron/muon to df to throw away all leptons that do not fulfill the isolation/leading criteria prior to the cut-flow. theta is computed from eta for all leptons at once and written to the df together with the filtered branches
+    df = df_filter(df,mask_electron,"electron","cut1",{"theta": eta_to_theta(rap_electron)})
+    df = df_filter(df,mask_muon,"muon","cut1",{"theta": eta_to_theta(rap_muon)})
     print("---cut1 applied!---")
     return df
 
@@ -233,28 +228,39 @@ def cut3(input_df,**kwargs):
 #cut4: upper and lower momentum cut for leptons
 #define cut4 for cut optimisation procedure to get best estimates for upper and lower momentum cut on highest energy lepton
 
+#momenta of all leptons as jagged awkward array (no round trip to lists)
 def calc_p(px,py,pz):
-    index = px.index
-    px,py,pz = ak.Array(px),ak.Array(py),ak.Array(pz)
-    p = np.sqrt(px**2+py**2+pz**2)
-    return pd.Series(data=p.to_list(),index=index)  
+    px,py,pz = to_ak(px),to_ak(py),to_ak(pz)
+    return np.sqrt(px**2+py**2+pz**2)
+
+#per-event cut variables for the cut optimisation: momentum of the highest energy lepton and missing energy (events without leptons get NaN). masks (see init_masks) restricts p_HE to the leptons that survived the previous cuts
+def p_HE(df,masks=None):
+    p_leptons = []
+    for lepton_name in ["electron","muon"]:
+        p_lepton = calc_p(df["{}_px".format(lepton_name)],df["{}_py".format(lepton_name)],df["{}_pz".format(lepton_name)])
+        p_leptons.append(p_lepton if masks is None else p_lepton[masks[lepton_name]])
+    return ak.to_numpy(ak.fill_none(ak.max(ak.concatenate(p_leptons,axis=1),axis=1),np.nan)).astype(np.float64)
+
+def ME(df):
+    Emiss_energy = df["Emiss_energy"]
+    if isinstance(Emiss_energy,pd.Series) and Emiss_energy.dtype != object:
+        return Emiss_energy.to_numpy(dtype=np.float64)
+    Emiss_energy = to_ak(Emiss_energy)
+    if Emiss_energy.ndim > 1:
+        Emiss_energy = ak.firsts(Emiss_energy)
+    return ak.to_numpy(ak.fill_none(Emiss_energy,np.nan)).astype(np.float64)
 
 def cut4(input_df,**kwargs):
     p_cut = kwargs["p_cut"]
     comparison = kwargs["comparison"]
     df = input_df.copy()
-    electron_px,electron_py,electron_pz = df["electron_px"],df["electron_py"],df["electron_pz"]
-    muon_px,muon_py,muon_pz = df["muon_px"],df["muon_py"],df["muon_pz"]
-    df["p_muon"] = calc_p(muon_px,muon_py,muon_pz)
-    df["p_electron"] = calc_p(electron_px,electron_py,electron_pz)
-    p_leptons = df["p_muon"]+df["p_electron"]
-    df["p_HE"] = p_leptons.apply(lambda row: ak.max(row)) #highest energy (HE) lepton per event
+    df["p_HE"] = p_HE(df) #highest energy (HE) lepton per event: electron and muon momenta are concatenated per event and ak.max is taken once over all events
     if comparison == ">":
         print("---Applying cut4: lower cut on highest energy lepton with p > {} GeV---".format(p_cut))
-        df["cut4_{}".format(comparison)] = df["p_HE"].apply(lambda p: p > p_cut)
+        df["cut4_{}".format(comparison)] = df["p_HE"] > p_cut
     elif comparison == "<":
         print("---Applying cut4: upper cut on highest energy lepton with p < {} GeV---".format(p_cut))
-        df["cut4_{}".format(comparison)] = df["p_HE"].apply(lambda p: p < p_cut)
+        df["cut4_{}".format(comparison)] = df["p_HE"] < p_cut
     else:
         raise ValueError("Invalid comparison operator")
     df = df[df["cut4_{}".format(comparison)]]
@@ -263,35 +269,150 @@ def cut4(input_df,**kwargs):
 
 #cut5: require semileptonic candidate to have impact parameter d_0 < 0.1mm (+and d0signif = d_0/sqrt(d_0variance) < 50) while having E_l > 20 GeV
 
-def PV_check(row_d0,row_d0signif,row_energy,d0,d0signif,p_lim):
-    tmp = []
-    if len(row_d0)!=0:
-        for i,val in enumerate(row_d0):
-            tmp.append((val<d0)&(row_d0signif[i]<d0signif)&(row_energy[i]>p_lim))
-    else:
-        tmp.append(False)
-    return tmp
+#PV criteria of each lepton, evaluated on the flattened lepton arrays and unflattened once. Events without leptons get an empty mask, i.e. ak.any is False for them
+def PV_mask(lepton_d0,lepton_d0signif,lepton_energy,d0,d0signif,p_lim):
+    counts = ak.num(lepton_d0,axis=1)
+    flat_d0,flat_d0signif,flat_energy = ak.to_numpy(ak.flatten(lepton_d0)),ak.to_numpy(ak.flatten(lepton_d0signif)),ak.to_numpy(ak.flatten(lepton_energy))
+    return ak.unflatten((flat_d0<d0)&(flat_d0signif<d0signif)&(flat_energy>p_lim),counts)
 
 def cut5(input_df,**kwargs):
     d0 = kwargs["d0"]
     d0signif = kwargs["d0_signif"]
     p_cut = kwargs["p_cut"]
     print("---Applying cut5: Require lepton candidate to have d0 < {} mm and d0_signif < {} plus possess p > {} GeV---".format(d0,d0signif,p_cut))
-    mask_electron,mask_muon = [],[]
     df = input_df.copy()
-    electron_d0,electron_d0signif,electron_energy = df["electron_d0"],df["electron_d0signif"],df["electron_energy"]
-    muon_d0,muon_d0signif,muon_energy = df["muon_d0"],df["muon_d0signif"],df["muon_energy"]
-    for i,index in enumerate(df.index):
-        mask_electron.append(PV_check(electron_d0[index],electron_d0signif[index],electron_energy[index],d0,d0signif,p_cut))
-        mask_muon.append(PV_check(muon_d0[index],muon_d0signif[index],muon_energy[index],d0,d0signif,p_cut))
+    mask_electron = PV_mask(to_ak(df["electron_d0"]),to_ak(df["electron_d0signif"]),to_ak(df["electron_energy"]),d0,d0signif,p_cut)
+    mask_muon = PV_mask(to_ak(df["muon_d0"]),to_ak(df["muon_d0signif"]),to_ak(df["muon_energy"]),d0,d0signif,p_cut)
     #apply filters to electrons and muons respectively
     df = df_filter(df,mask_electron,"electron","cut5")
     df = df_filter(df,mask_muon,"muon","cut5")
-    df["cut5"] = df["cut5_electron"].apply(lambda row: any(row)) | df["cut5_electron"].apply(lambda row: any(row))
+    df["cut5"] = ak.to_numpy(ak.any(mask_electron,axis=1) | ak.any(mask_muon,axis=1))
     df = df[df["cut5"]]
     print("---cut5 applied!---")
     return df
 
+###
+#Copy-free cut chain: the events are kept in one immutable awkward array and the cuts only compute event-level and object-level (per lepton) masks. The data is only materialised once after the last cut (see materialise)
+###
+
+def fields(df):
+    return df.fields if isinstance(df,ak.Array) else df.columns
+
+def to_events(df):
+    if isinstance(df,ak.Array):
+        return df
+    return ak.Array({column: to_ak(df[column]) if df[column].dtype==object else df[column].to_numpy() for column in df.columns})
+
+#cut_bits: bit i is set if the event survived cuts 1..i+1 of cut_dic (see cut_flow), i.e. up to 32 cuts
+def init_masks(df_events):
+    return {"event": np.ones(len(df_events),dtype=bool),
+            "cut_bits": np.zeros(len(df_events),dtype=np.uint32),
+            "electron": ak.ones_like(df_events["electron_energy"],dtype=bool),
+            "muon": ak.ones_like(df_events["muon_energy"],dtype=bool)}
+
+#each mask cut takes the events and the masks of the previous cuts and returns the updated masks (the input masks are not modified)
+def cut1_mask(df_events,masks,**kwargs):
+    jet_algo = kwargs["jet_algo"]
+    print("---Applying cut1: Require lepton candidate to be isolated from all jets with dR > 0.4 or being the leading particle within the jet---")
+    masks = dict(masks)
+    phi_jet, rap_jet, jet_energy = df_events["jet_{}_phi".format(jet_algo)],df_events["jet_{}_eta".format(jet_algo)],df_events["jet_{}_energy".format(jet_algo)]
+    for lepton_name in ["electron","muon"]:
+        masks[lepton_name] = masks[lepton_name] & isolation_mask(df_events["{}_phi".format(lepton_name)],phi_jet,df_events["{}_eta".format(lepton_name)],rap_jet,jet_energy,df_events["{}_energy".format(lepton_name)],0.5)
+    print("---cut1 applied!---")
+    return masks
+
+def cut2_mask(df_events,masks,**kwargs):
+    print("---Applying cut2: Require n_muons(n_electrons) > 0---")
+    masks = dict(masks)
+    masks["cut2_electron"] = ak.to_numpy(ak.sum(masks["electron"],axis=1))!=0
+    masks["cut2_muon"] = ak.to_numpy(ak.sum(masks["muon"],axis=1))!=0
+    masks["event"] = masks["event"] & (masks["cut2_muon"] | masks["cut2_electron"])
+    print("---cut2 applied!---")
+    return masks
+
+def cut3_mask(df_events,masks,**kwargs):
+    ME_cut = kwargs["ME_cut"]
+    print("---Applying cut3: ME > {} GeV---".format(ME_cut))
+    masks = dict(masks)
+    masks["event"] = masks["event"] & (ME(df_events) > ME_cut)
+    print("---cut3 applied!---")
+    return masks
+
+def cut4_mask(df_events,masks,**kwargs):
+    p_cut = kwargs["p_cut"]
+    comparison = kwargs["comparison"]
+    masks = dict(masks)
+    p = p_HE(df_events,masks) #highest energy (HE) lepton per event
+    if comparison == ">":
+        print("---Applying cut4: lower cut on highest energy lepton with p > {} GeV---".format(p_cut))
+        masks["event"] = masks["event"] & (p > p_cut)
+    elif comparison == "<":
+        print("---Applying cut4: upper cut on highest energy lepton with p < {} GeV---".format(p_cut))
+        masks["event"] = masks["event"] & (p < p_cut)
+    else:
+        raise ValueError("Invalid comparison operator")
+    print("---cut4_{} applied!---".format(comparison))
+    return masks
+
+def cut5_mask(df_events,masks,**kwargs):
+    d0 = kwargs["d0"]
+    d0signif = kwargs["d0_signif"]
+    p_cut = kwargs["p_cut"]
+    print("---Applying cut5: Require lepton candidate to have d0 < {} mm and d0_signif < {} plus possess p > {} GeV---".format(d0,d0signif,p_cut))
+    masks = dict(masks)
+    for lepton_name in ["electron","muon"]:
+        masks[lepton_name] = masks[lepton_name] & PV_mask(df_events["{}_d0".format(lepton_name)],df_events["{}_d0signif".format(lepton_name)],df_events["{}_energy".format(lepton_name)],d0,d0signif,p_cut)
+    masks["event"] = masks["event"] & ak.to_numpy(ak.any(masks["electron"],axis=1) | ak.any(masks["muon"],axis=1))
+    print("---cut5 applied!---")
+    return masks
+
+#branches read by each mask cut (for the given cut limits). required_branches returns the union for a cut chain plus the branches needed for the truth classes and the (x,cosTheta) distributions, only these are loaded by events_load/df_load_chunks
+def cut1_branches(**kwargs):
+    jet_algo = kwargs["jet_algo"]
+    return ["{}_{}".format(lepton_name,var) for lepton_name in ["electron","muon"] for var in ["phi","eta","energy"]]+["jet_{}_{}".format(jet_algo,var) for var in ["phi","eta","energy"]]
+
+def cut2_branches(**kwargs):
+    return []
+
+def cut3_branches(**kwargs):
+    return ["Emiss_energy"]
+
+def cut4_branches(**kwargs):
+    return ["{}_{}".format(lepton_name,var) for lepton_name in ["electron","muon"] for var in ["px","py","pz"]]
+
+def cut5_branches(**kwargs):
+    return ["{}_{}".format(lepton_name,var) for lepton_name in ["electron","muon"] for var in ["d0","d0signif","energy"]]
+
+cut_branches = {cut1_mask: cut1_branches,cut2_mask: cut2_branches,cut3_mask: cut3_branches,cut4_mask: cut4_branches,cut5_mask: cut5_branches}
+
+base_branches = ["genElectron_parentPDG","genMuon_parentPDG"]+["{}_{}".format(lepton_name,var) for lepton_name in ["electron","muon"] for var in ["eta","energy","charge"]]
+
+#returns None (i.e. load all branches) if a cut in cut_dic has not declared its branches in cut_branches
+def required_branches(cut_dic,cut_limits_dic):
+    if any(cut_dic[cut_name] not in cut_branches for cut_name in cut_dic):
+        return None
+    columns = set(base_branches)
+    for cut_name in cut_dic:
+        columns.update(cut_branches[cut_dic[cut_name]](**cut_limits_dic[cut_name]))
+    return sorted(columns)
+
+#build the events that survived all cuts with the same columns the df based cuts produce (filtered lepton branches, {lepton}_theta, n_{lepton}s, cut2_{lepton})
+def materialise(df_events,masks):
+    df_out = df_events
+    for lepton_name in ["electron","muon"]:
+        for var in lepton_vars:
+            if var == "theta":
+                column = eta_to_theta(df_events["{}_eta".format(lepton_name)])
+            elif "{}_{}".format(lepton_name,var) in df_events.fields:
+                column = df_events["{}_{}".format(lepton_name,var)]
+            else:
+                continue
+            df_out = ak.with_field(df_out,column[masks[lepton_name]],"{}_{}".format(lepton_name,var))
+        df_out = ak.with_field(df_out,ak.sum(masks[lepton_name],axis=1),"n_{}s".format(lepton_name))
+        if "cut2_{}".format(lepton_name) in masks:
+            df_out = ak.with_field(df_out,masks["cut2_{}".format(lepton_name)],"cut2_{}".format(lepton_name))
+    return df_out[masks["event"]]
+
 ###
 #Calculate efficiency and purity of cut-flow
 ###
@@ -319,17 +440,26 @@ def events_bruteforce(df,n_Wleptons):
     Muon_Wplus = pd.Series(data=Muon_Wplus,index=df.index)==n_Wleptons
     return (sum(Electron_Wminus)+sum(Electron_Wplus)+sum(Muon_Wminus)+sum(Muon_Wplus))
 
-
-def events(df,n_Wleptons):
-    if df.empty:
+#truth classification of each event: number of genElectrons+genMuons originating from a W or t (PDG code: +-24, +-6). Each of these leptons appears twice in the gen record, hence an event with n W leptons has genW_leptons = 2n. The truth labels are not changed by reco cuts, i.e. they are computed once at load time and stored as int8 column in the df
+def truth_class(df):
+    n_genW = 0
+    for genLepton in ["genElectron","genMuon"]:
+        parentPDG = np.abs(to_ak(df["{}_parentPDG".format(genLepton)]))
+        n_genW = n_genW + ak.to_numpy(ak.sum((parentPDG==24)|(parentPDG==6),axis=1))
+    return np.minimum(n_genW,np.iinfo(np.int8).max).astype(np.int8)
+
+#df can be a pandas df or an awkward array of events (see to_events). event_mask optionally restricts the count to the events that survived the cuts
+def signal_mask(df,n_Wleptons):
+    genW_leptons = np.asarray(df["genW_leptons"]) if "genW_leptons" in fields(df) else truth_class(df)
+    return genW_leptons==2*n_Wleptons
+
+def events(df,n_Wleptons,event_mask=None):
+    if len(df)==0:
         return 0
-    else:
-        Electron_Wplus = df["genElectron_parentPDG"].apply(lambda row: row.count(24)/2+row.count(6)/2)
-        Muon_Wplus = df["genMuon_parentPDG"].apply(lambda row: row.count(24)/2+row.count(6)/2)
-        Electron_Wminus = df["genElectron_parentPDG"].apply(lambda row: row.count(-24)/2+row.count(-6)/2)
-        Muon_Wminus = df["genMuon_parentPDG"].apply(lambda row: row.count(-24)/2+row.count(-6)/2)
-        Leptons_W = Electron_Wplus + Muon_Wplus + Electron_Wminus + Muon_Wminus
-        return sum(Leptons_W == n_Wleptons )
+    signal = signal_mask(df,n_Wleptons)
+    if event_mask is not None:
+        signal = signal[event_mask]
+    return int(np.count_nonzero(signal))
 
 
 #define signal significance and signal purity (both semileptonic top decays as well as allhadronic ones are considered "signal" -> distinguish eff and pur for semileptonic and hadronic events in the cut-flow tho!)
@@ -342,14 +472,16 @@ def eff_std(k_s,n_s):
 def pur_std(k_s,k_b,n_s,n_b):
     return np.sqrt(k_s**3/(k_s+k_b)**6 * (1-k_s/n_s)+k_s**2*k_b/(k_s+k_b)**4 * (1-k_b/n_b))
 
-def signal_eff_pur(cut_dic,jet_algo,**kwargs):
+#replicas: {channel: bootstrap replica tables times R} (see bootstrap.py), adds the bootstrap uncertainties of eff and pur to the tables
+def signal_eff_pur(cut_dic,jet_algo,replicas=None,**kwargs):
     table_SL,table_AH = [],[]
     n_lephad,n_hadlep,n_hadhad = kwargs["tlepThad"],kwargs["thadTlep"],kwargs["thadThad"]
+    boot = bootstrap_eff_pur(**replicas) if replicas is not None else None
     for i,cut_name in enumerate(cut_dic):
         if i==0:
             n_tot_SL,n_tot_AH = n_lephad[i]+n_hadlep[i],n_hadhad[i] #total number of events before all cuts
         else:
-            k_SL,k_AH = n_lephad[i]+n_lephad[i],n_hadhad[i] #number of events after each cut
+            k_SL,k_AH = n_lephad[i]+n_hadlep[i],n_hadhad[i] #number of events after each cut
             k = k_SL+k_AH
             dic_SL, dic_AH = {}, {}
             dic_SL["tT semileptonic"],dic_AH["tT full hadronic"] = cut_name, cut_name
@@ -357,6 +489,9 @@ def signal_eff_pur(cut_dic,jet_algo,**kwargs):
             dic_SL[r"$\sigma_{\epsilon}$ [%]"],dic_AH[r"$\sigma_{\epsilon}$ [%]"] = np.round(eff_std(k_SL,n_tot_SL)*100,5),np.round(eff_std(k_AH,n_tot_AH)*100,5)
             dic_SL[r"$\pi$ [%]"], dic_AH[r"$\pi$ [%]"] = np.round((k_SL/k)*100,5),np.round((k_AH/k)*100,5)
             dic_SL[r"$\sigma_{\pi}$ [%]"],dic_AH[r"$\sigma_{\pi}$ [%]"] = np.round(pur_std(k_SL,k_AH,n_tot_SL,n_tot_AH)*100,5),np.round(pur_std(k_AH,k_SL,n_tot_AH,n_tot_SL)*100,5)
+            if boot is not None:
+                dic_SL[r"$\sigma_{\epsilon}^{boot}$ [%]"],dic_AH[r"$\sigma_{\epsilon}^{boot}$ [%]"] = np.round(boot["eff_SL"][i]*100,5),np.round(boot["eff_AH"][i]*100,5)
+                dic_SL[r"$\sigma_{\pi}^{boot}$ [%]"],dic_AH[r"$\sigma_{\pi}^{boot}$ [%]"] = np.round(boot["pur_SL"][i]*100,5),np.round(boot["pur_AH"][i]*100,5)
             table_SL.append(dic_SL)
             table_AH.append(dic_AH)
     print("---Using jet_{} as jet_algo---".format(jet_algo))
@@ -367,16 +502,33 @@ def signal_eff_pur(cut_dic,jet_algo,**kwargs):
     return table_SL,table_AH
 
 #Define cut-flow -> specify decay channel (because cut flow is applied to tlepThad,thadTlep and thadThad respectively)  -> apply cut flow to df iteratively and calculate number of allhadronic/semileptonic events that remain after each cut to later calculate eff and pur with these numbers
-def cut_flow(df,cut_dic,cut_limits_dic,decay_channel,R):
+#the cuts in cut_dic are the mask cuts (cut1_mask,...,cut5_mask), i.e. the events are converted only once and the surviving events are materialised after the last cut. If a list is passed as profile, one record per cut (wall time, peak RSS delta, events/leptons in and out) is appended to it, see profiling.py
+#cache: list with one cache file per cut (see cut_cache.prefix_paths), the chain is resumed after the longest prefix of cut_dic that is already cached. The profile only contains the cuts that were actually evaluated
+#if a dict is passed as bits, the cut-pass bitmask of the signal events (see init_masks) is stored in it as bits["cut_bits"] for the bootstrap (see bootstrap.py)
+def cut_flow(df,cut_dic,cut_limits_dic,decay_channel,R,profile=None,cache=None,bits=None):
     table_s = [] #store amount of full hadronic/semileptonic signal events after each cut
-    if (decay_channel=="tlepThad")|(decay_channel=="thadTlep"):
-        n_Wleptons = 1
-    elif (decay_channel=="thadThad"):
-        n_Wleptons = 0
-    for cut_name in cut_dic:
-        df = cut_dic[cut_name](df,**cut_limits_dic[cut_name])
-        table_s.append(events(df,n_Wleptons))
-    return df,R*np.array(table_s)
+    n_Wleptons = W_leptons(decay_channel)
+    df_events = to_events(df)
+    masks = init_masks(df_events)
+    n_cached = 0
+    if cache is not None:
+        n_cached,cached_masks,table_s = resume(cache)
+        masks = cached_masks if n_cached>0 else masks
+    for i,cut_name in enumerate(cut_dic):
+        if i < n_cached:
+            continue
+        if profile is not None:
+            before = snapshot(masks,start=True)
+        masks = cut_dic[cut_name](df_events,masks,**cut_limits_dic[cut_name])
+        masks = {**masks,"cut_bits": masks["cut_bits"] | (masks["event"].astype(np.uint32) << np.uint32(i))}
+        if profile is not None:
+            profile.append(record(cut_name,before,snapshot(masks)))
+        table_s.append(events(df_events,n_Wleptons,masks["event"]))
+        if cache is not None:
+            save_masks(cache[i],masks,table_s)
+    if bits is not None:
+        bits["cut_bits"] = masks["cut_bits"][signal_mask(df_events,n_Wleptons)] if len(df_events)>0 else masks["cut_bits"]
+    return materialise(df_events,masks),R*np.array(table_s)
 
 ###
 # apply filters and leptons
@@ -414,26 +566,22 @@ def lxcosTheta(df):
 #apply filters for genLeptons
 ###
 
-#create mask for leptons originating from a W+ or W- (PDG code: +-24)
-def genMask(row):
-    row_bool = (np.abs(np.array(row)) == 24) | (np.abs(np.array(row)) == 6)
-    if(sum(row_bool)>1):
-        row_bool[np.where(row_bool==1)[0][1:]]=False #this deletes duplicated semileptonic muons or electrons 
-    return row_bool
+#mask for the genLeptons originating from a W+ or W- (PDG code: +-24) or t (+-6). Each of these leptons appears twice in the gen record, only the first entry per event is kept
+def genW_mask(genLepton_parentPDG):
+    from_W = (np.abs(genLepton_parentPDG) == 24) | (np.abs(genLepton_parentPDG) == 6)
+    first = ak.local_index(from_W,axis=1) == ak.argmax(from_W,axis=1,keepdims=True)
+    return from_W & first
 
 def LxcosTheta(df):
     s = 365**2 #square of centre of mass energy in GeV
     m_t = 173 #top mass in GeV
     beta = np.sqrt(1-(4*m_t**2)/s) #top velocity
     c_0 = constants.speed_of_light
-    df["pT_genElectron"] = np.sqrt(df["genElectron_px"]**2+df["genElectron_py"]**2)
-    df["pT_genMuon"] = np.sqrt(df["genMuon_px"]**2+df["genMuon_py"]**2)
-    df["Theta_genElectron"] = genTheta(df["pT_genElectron"],df["genElectron_pz"])
-    df["Theta_genMuon"] = genTheta(df["pT_genMuon"],df["genMuon_pz"])          
-    df["genElectron_ID_24"] = df["genElectron_parentPDG"].apply(lambda row: genMask(row)) 
-    df["genMuon_ID_24"] = df["genMuon_parentPDG"].apply(lambda row: genMask(row)) 
-    genElectron_mask = np.array(ak.flatten(df["genElectron_ID_24"]))
-    genMuon_mask = np.array(ak.flatten(df["genMuon_ID_24"]))
+    #polar angle of all genLeptons of all events at once (see kinematics.py)
+    Theta_genElectron = ak.to_numpy(ak.flatten(theta(to_ak(df["genElectron_px"]),to_ak(df["genElectron_py"]),to_ak(df["genElectron_pz"]))))
+    Theta_genMuon = ak.to_numpy(ak.flatten(theta(to_ak(df["genMuon_px"]),to_ak(df["genMuon_py"]),to_ak(df["genMuon_pz"]))))
+    genElectron_mask = ak.to_numpy(ak.flatten(genW_mask(to_ak(df["genElectron_parentPDG"]))))
+    genMuon_mask = ak.to_numpy(ak.flatten(genW_mask(to_ak(df["genMuon_parentPDG"]))))
     genElectron_charge = np.array(ak.flatten(df["genElectron_charge"]))
     genMuon_charge = np.array(ak.flatten(df["genMuon_charge"]))
     genElectron_plus = genElectron_mask & (genElectron_charge == 1)
@@ -441,8 +589,8 @@ def LxcosTheta(df):
     genMuon_plus = genMuon_mask & (genMuon_charge == 1)
     genMuon_minus = genMuon_mask & (genMuon_charge == -1) 
     #import arrays and apply masks
-    Theta_genElectron, genElectron_energy = np.array(ak.flatten(df["Theta_genElectron"])),np.array(ak.flatten(df["genElectron_energy"]))
-    Theta_genMuon, genMuon_energy = np.array(ak.flatten(df["Theta_genMuon"])), np.array(ak.flatten(df["genMuon_energy"]))
+    genElectron_energy = np.array(ak.flatten(df["genElectron_energy"]))
+    genMuon_energy = np.array(ak.flatten(df["genMuon_energy"]))
     x_genElectron = 2*genElectron_energy/m_t*np.sqrt((1-beta)/(1+beta))
     x_genMuon = 2*genMuon_energy/m_t*np.sqrt((1-beta)/(1+beta))
     Theta_genEplus = Theta_genElectron[genElectron_plus]
@@ -0,0 +1,107 @@
+import numpy as np
+import awkward as ak
+from cut_flow_functions import to_ak,p_HE,ME
+
+'''
+Cut optimisation without re-running the cuts: the cut variable (e.g. p_HE or ME) is computed once per event, sorted and turned into cumulative sums of the event weights. The weighted number of events that pass the cut is then read off for all thresholds at once
+'''
+
+#event weights for the scan: R_channel for events of the requested truth class (see truth_class/events in cut_flow_functions), 0 otherwise
+def scan_weights(df,R,n_Wleptons):
+    return R*(df["genW_leptons"].to_numpy()==2*n_Wleptons)
+
+#weighted number of events with value > t (comparison ">") or value < t (comparison "<") for every threshold t. Events with NaN values never pass
+def passed(values,weights,thresholds,comparison):
+    valid = ~np.isnan(values)
+    order = np.argsort(values[valid],kind="stable")
+    values_sorted = values[valid][order]
+    cum_weights = np.concatenate(([0.],np.cumsum(np.asarray(weights,dtype=np.float64)[valid][order])))
+    if comparison == ">":
+        return cum_weights[-1]-cum_weights[np.searchsorted(values_sorted,thresholds,side="right")]
+    elif comparison == "<":
+        return cum_weights[np.searchsorted(values_sorted,thresholds,side="left")]
+    else:
+        raise ValueError("Invalid comparison operator")
+
+#efficiency and purity of the signal for all thresholds. signal/background are lists of (values,weights) per channel, e.g. [(p_HE(df_lephad),scan_weights(df_lephad,R_lephad,1)),...]. n_s is the weighted number of signal events before the cut
+def threshold_scan(signal,background,thresholds,comparison):
+    k_s = sum(passed(values,weights,thresholds,comparison) for values,weights in signal)
+    k_b = sum(passed(values,weights,thresholds,comparison) for values,weights in background)
+    n_s = sum(np.sum(weights) for values,weights in signal)
+    with np.errstate(divide="ignore",invalid="ignore"):
+        return k_s/n_s,k_s/(k_s+k_b)
+
+###
+#Joint optimisation of cut3 (ME_cut), cut4 (p_cut, lower cut) and cut5 (d0, d0_signif, p_cut) on a N-D grid
+###
+
+'''
+An event passes the cuts (ME_cut,p_cut,d0,d0_signif) if ME > ME_cut, p_HE > p_cut and at least one lepton l fulfills d0_l < d0, d0signif_l < d0_signif and E_l > p_cut (cut5). 
+The "at least one lepton" condition is written with inclusion-exclusion as a signed sum over all non-empty lepton subsets S of the event: every subset passes iff the point lies beyond its corner (ME, min(p_HE,min_S E), max_S d0, max_S d0signif).
+The signed weights are filled into a N-D histogram at the grid index of each corner and a cumulative sum along each axis then gives the weighted number of passing events for all grid points at once
+'''
+
+#cumulative sum of hist along axis: ">" cuts pass for all grid points below the corner index, "<" cuts for all grid points above it (hist has one more bin than the grid along each axis)
+def cumulative(hist,axis,comparison):
+    if comparison == ">":
+        return np.take(np.flip(np.cumsum(np.flip(hist,axis),axis),axis),np.arange(1,hist.shape[axis]),axis=axis)
+    elif comparison == "<":
+        return np.take(np.cumsum(hist,axis),np.arange(hist.shape[axis]-1),axis=axis)
+    else:
+        raise ValueError("Invalid comparison operator")
+
+#weighted number of passing events on the grid. corners: list of per-entry corner coordinates (one array per axis), weights: signed weight per entry
+def grid_counts(corners,weights,grids,comparisons):
+    index = []
+    for values,grid,comparison in zip(corners,grids,comparisons):
+        index.append(np.searchsorted(grid,values,side="left" if comparison==">" else "right"))
+    shape = tuple(len(grid)+1 for grid in grids)
+    hist = np.bincount(np.ravel_multi_index(index,shape),weights=weights,minlength=np.prod(shape)).reshape(shape)
+    for axis,comparison in enumerate(comparisons):
+        hist = cumulative(hist,axis,comparison)
+    return hist
+
+grid_vars = ["ME_cut","p_cut","d0","d0_signif"]
+grid_comparisons = [">",">","<","<"]
+
+#corners and signed weights of all lepton subsets of all events of a df (after cut1 and cut2)
+def grid_corners(df,weights):
+    lepton = ak.zip({var: ak.concatenate([to_ak(df["electron_{}".format(var)]),to_ak(df["muon_{}".format(var)])],axis=1) for var in ["d0","d0signif","energy"]})
+    ME_event,p_event = ME(df),p_HE(df)
+    weights = np.where(np.isnan(ME_event)|np.isnan(p_event),0.,weights) #events without leptons/ME never pass
+    corners,signed_weights = [[] for var in grid_vars],[]
+    for r in range(1,int(ak.max(ak.num(lepton),initial=0))+1):
+        subsets = ak.unzip(ak.combinations(lepton,r,axis=1)) if r>1 else (lepton,)
+        energy_min = subsets[0].energy
+        d0_max,d0signif_max = subsets[0].d0,subsets[0].d0signif
+        for subset in subsets[1:]:
+            energy_min = np.minimum(energy_min,subset.energy)
+            d0_max,d0signif_max = np.maximum(d0_max,subset.d0),np.maximum(d0signif_max,subset.d0signif)
+        n_subsets = ak.to_numpy(ak.num(energy_min))
+        p_subset = np.minimum(ak.to_numpy(ak.flatten(energy_min)),np.repeat(p_event,n_subsets))
+        for i,values in enumerate([np.repeat(ME_event,n_subsets),p_subset,ak.to_numpy(ak.flatten(d0_max)),ak.to_numpy(ak.flatten(d0signif_max))]):
+            corners[i].append(values)
+        signed_weights.append((-1)**(r+1)*np.repeat(weights,n_subsets))
+    return [np.concatenate(values) for values in corners],np.concatenate(signed_weights)
+
+#efficiency and purity on the full grid. signal/background are lists of (df,weights) per channel with the weights from scan_weights, grids maps the names in grid_vars to the cut values to be scanned. Returns the same structure as the 1-D cut optimisation, i.e. {var: grid,...,"epsilon":eff,"pi":pur} with eff/pur of shape (len(grid_ME_cut),len(grid_p_cut),...)
+def grid_scan(signal,background,grids):
+    grid_list = [np.asarray(grids[var],dtype=np.float64) for var in grid_vars]
+    k_s,k_b = 0.,0.
+    for df,weights in signal:
+        k_s = k_s + grid_counts(*grid_corners(df,weights),grid_list,grid_comparisons)
+    for df,weights in background:
+        k_b = k_b + grid_counts(*grid_corners(df,weights),grid_list,grid_comparisons)
+    n_s = sum(np.sum(weights) for df,weights in signal)
+    cut_result = {var: grid for var,grid in zip(grid_vars,grid_list)}
+    with np.errstate(divide="ignore",invalid="ignore"):
+        cut_result["epsilon"],cut_result["pi"] = k_s/n_s,k_s/(k_s+k_b)
+    return cut_result
+
+#best grid point w.r.t. the figure of merit (default eps*pi), returned in the format of cut_limits in FCCee_topEWK.py
+def best_cut(cut_result,fom=lambda eff,pur: eff*pur):
+    values = np.nan_to_num(fom(cut_result["epsilon"],cut_result["pi"]),nan=-np.inf)
+    best = dict(zip(grid_vars,(float(cut_result[var][i]) for var,i in zip(grid_vars,np.unravel_index(np.argmax(values),values.shape)))))
+    return {"cut3": {"ME_cut": best["ME_cut"]},
+            "cut4": {"p_cut": best["p_cut"],"comparison": ">"},
+            "cut5": {"d0": best["d0"],"d0_signif": best["d0_signif"],"p_cut": best["p_cut"]}}
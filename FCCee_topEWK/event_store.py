@@ -0,0 +1,77 @@
+import sys
+import numpy as np
+import pandas as pd
+import awkward as ak
+from pathlib import Path
+
+'''
+Columnar on-disk store for the ntuples. Each pickled df is converted once into a directory next to the pickle (same name without ".pkl") holding one file per branch:
+    <branch>.npy                                  for flat branches (one value per event)
+    <branch>.offsets.npy + <branch>.content.npy   for jagged branches (list of values per event)
+The npy files are memory-mapped and loaded lazily (see load_store), i.e. only the branches a cut needs are read from disk and only when they are accessed
+'''
+
+def store_path(pkl_path):
+    pkl_path = Path(pkl_path)
+    return pkl_path.with_name(pkl_path.name[:-len(".pkl")]) if pkl_path.name.endswith(".pkl") else pkl_path
+
+def convert_pickle(pkl_path):
+    df = pd.read_pickle(pkl_path)
+    path = store_path(pkl_path)
+    path.mkdir(parents=True,exist_ok=True)
+    for branch in df.columns:
+        if df[branch].dtype == object:
+            array = ak.Array(df[branch].to_list())
+            content = ak.flatten(array)
+            np.save(path/"{}.offsets.npy".format(branch),np.asarray(array.layout.offsets,dtype=np.int64))
+            np.save(path/"{}.content.npy".format(branch),np.asarray(ak.to_numpy(content) if len(content) else np.zeros(0)))
+        else:
+            np.save(path/"{}.npy".format(branch),df[branch].to_numpy())
+    return path
+
+def branches(path):
+    path = Path(path)
+    flat = [f.name[:-len(".npy")] for f in path.glob("*.npy") if not f.name.endswith((".offsets.npy",".content.npy"))]
+    jagged = [f.name[:-len(".offsets.npy")] for f in path.glob("*.offsets.npy")]
+    return sorted(flat+jagged)
+
+#form of a branch for ak.from_buffers, only the npy headers are read (the buffers are memory-mapped)
+def branch_form(path,branch):
+    if (path/"{}.npy".format(branch)).exists():
+        data = np.load(path/"{}.npy".format(branch),mmap_mode="r")
+        return ak.forms.NumpyForm(ak.forms.from_dtype(data.dtype).primitive,form_key=branch),len(data)
+    offsets = np.load(path/"{}.offsets.npy".format(branch),mmap_mode="r")
+    content = np.load(path/"{}.content.npy".format(branch),mmap_mode="r")
+    return ak.forms.ListOffsetForm("i64",ak.forms.NumpyForm(ak.forms.from_dtype(content.dtype).primitive,form_key="{}.content".format(branch)),form_key="{}.offsets".format(branch)),len(offsets)-1
+
+def buffer_loader(path,filename):
+    return lambda: np.load(path/filename,mmap_mode="r")
+
+#the branches are loaded lazily: a branch is only read from disk (memory-mapped) the first time it is accessed, branches that are never used by the cuts never touch the memory
+def load_store(path,columns=None):
+    path = Path(path)
+    if columns is None:
+        columns = branches(path)
+    forms,container,length = [],{},0
+    for branch in columns:
+        form,length = branch_form(path,branch)
+        forms.append(form)
+        if isinstance(form,ak.forms.NumpyForm):
+            container["{}-data".format(branch)] = buffer_loader(path,"{}.npy".format(branch))
+        else:
+            container["{}.offsets-offsets".format(branch)] = buffer_loader(path,"{}.offsets.npy".format(branch))
+            container["{}.content-data".format(branch)] = buffer_loader(path,"{}.content.npy".format(branch))
+    return ak.from_buffers(ak.forms.RecordForm(forms,list(columns)),length,container)
+
+#Build a df with the same layout as the pickled ntuples (jagged branches as lists) from the columnar store
+def events_to_df(events):
+    return pd.DataFrame({branch: events[branch].to_list() if events[branch].ndim > 1 else events[branch].to_numpy() for branch in events.fields})
+
+def store_to_df(path,columns=None):
+    return events_to_df(load_store(path,columns))
+
+#convert pickles given as arguments, e.g. python event_store.py /ceph/skeilbach/FCCee_topEWK/*.pkl
+if __name__ == "__main__":
+    for pkl_path in sys.argv[1:]:
+        print("---Converting {} to {}---".format(pkl_path,store_path(pkl_path)))
+        convert_pickle(pkl_path)
@@ -0,0 +1,44 @@
+import numpy as np
+
+'''
+Histograms with fixed uniform axes. An axis is a tuple (n_bins,low,high), the bin index of each value is computed directly from the axis (no search over the edges) and the histogram is filled with np.bincount. The histograms hold the (unweighted) number of entries times a scalar weight, i.e. no weight arrays are allocated, and histograms with the same axes can be added exactly, e.g. the unnormalised histograms of the chunks of a sample or of parallel workers are added first and scaled with R once at the end. Values outside [low,high] are dropped, values equal to high go into the last bin (same convention as np.histogram)
+'''
+
+#analysis binning of the (x,cosTheta) templates. The reduced energy of the lepton from the top decay is kinematically limited to x <= 1, i.e. leptons with x > 1 (E > ~119.8 GeV, fakes or resolution tails) are not part of the templates. They are counted with n_outside and reported by the driver (see cut_flow_driver.xcosTheta_hist)
+x_axis = (25,0.,1.)
+cosTheta_axis = (25,-1.,1.)
+
+def edges(axis):
+    n_bins,low,high = axis
+    return np.linspace(low,high,n_bins+1)
+
+#bin index of each value, -1 for values outside the axis (and NaN). The index computed from the bin width is corrected by one bin where rounding put a value on the wrong side of an edge, so that the result agrees with np.histogram(values,edges(axis))
+def bin_index(values,axis):
+    n_bins,low,high = axis
+    values = np.asarray(values,dtype=np.float64)
+    bin_edges = edges(axis)
+    inside = (values >= low) & (values <= high)
+    values_inside = values[inside]
+    index_inside = np.minimum(((values_inside-low)*(n_bins/(high-low))).astype(np.int64),n_bins-1)
+    index_inside -= values_inside < bin_edges[index_inside]
+    index_inside += (values_inside >= bin_edges[index_inside+1]) & (index_inside < n_bins-1)
+    index = np.full(len(values),-1,dtype=np.int64)
+    index[inside] = index_inside
+    return index
+
+def fill1d(values,axis,weight=1.):
+    index = bin_index(values,axis)
+    return weight*np.bincount(index[index>=0],minlength=axis[0]).astype(np.float64)
+
+def fill2d(x,y,x_axis,y_axis,weight=1.):
+    index_x,index_y = bin_index(x,x_axis),bin_index(y,y_axis)
+    inside = (index_x>=0) & (index_y>=0)
+    counts = np.bincount(index_x[inside]*y_axis[0]+index_y[inside],minlength=x_axis[0]*y_axis[0])
+    return weight*counts.reshape(x_axis[0],y_axis[0]).astype(np.float64)
+
+#number of entries outside the axes times weight, i.e. the entries fill2d drops
+def n_outside(x,y,x_axis,y_axis,weight=1.):
+    return weight*np.count_nonzero((bin_index(x,x_axis)<0) | (bin_index(y,y_axis)<0))
+
+def empty2d(x_axis,y_axis):
+    return np.zeros((x_axis[0],y_axis[0]))
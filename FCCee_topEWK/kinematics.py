@@ -0,0 +1,33 @@
+import numpy as np
+import awkward as ak
+
+'''
+Columnar kinematics: angles and pseudorapidity of all particles of all events in one numpy call per column. Jagged awkward arrays (events x particles) are flattened, the numpy function is evaluated on the flat content and the result is put back into the jagged structure of the input. Flat (one value per event) awkward or numpy arrays are evaluated directly
+'''
+
+def columnar(func,*arrays):
+    arrays = [ak.Array(array) if not isinstance(array,ak.Array) else array for array in arrays]
+    if arrays[0].ndim == 1:
+        return ak.Array(func(*[ak.to_numpy(array) for array in arrays]))
+    counts = ak.num(arrays[0],axis=1)
+    return ak.unflatten(func(*[ak.to_numpy(ak.flatten(array)) for array in arrays]),counts)
+
+#transverse momentum
+def pT(px,py):
+    return columnar(np.hypot,px,py)
+
+#azimuthal angle in [0,2pi) (same convention as the old per-lepton loop, px=0 or py=0 is handled by arctan2 as well)
+def phi(px,py):
+    return columnar(lambda px,py: np.mod(np.arctan2(py,px),2*np.pi),px,py)
+
+#polar angle in [0,pi] from the momentum components
+def theta(px,py,pz):
+    return columnar(lambda px,py,pz: np.arccos(np.clip(pz/np.sqrt(px**2+py**2+pz**2),-1,1)),px,py,pz)
+
+#polar angle in [0,pi] from the pseudorapidity
+def eta_to_theta(eta):
+    return columnar(lambda eta: 2*np.arctan(np.exp(-eta)),eta)
+
+#pseudorapidity from the polar angle
+def pseudorap(theta):
+    return columnar(lambda theta: -np.log(np.tan(theta/2)),theta)
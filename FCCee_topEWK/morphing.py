@@ -0,0 +1,34 @@
+import numpy as np
+from sample_norms import coupling_shift
+from histograms import x_axis,cosTheta_axis
+from results_archive import load_templates
+
+'''
+Template morphing of the (x,cosTheta) distribution to arbitrary values of the couplings in sample_norms.coupling_shift. The amplitude is linear in the couplings, i.e. each bin of the distribution is quadratic in each coupling g_j:
+    n(g) = n_SM + sum_j (t_j*L_j + t_j**2*Q_j)    with t_j = g_j/coupling_shift[j]
+The linear and quadratic basis templates follow from the SM and the up (t_j=+1) and down (t_j=-1) variation histograms:
+    L_j = (n_up-n_down)/2,  Q_j = (n_up+n_down)/2-n_SM
+so the variation samples are reproduced exactly. Interference terms between different couplings (t_j*t_k) can not be determined from the one-at-a-time variations and are neglected. The prediction is not clipped, i.e. bins can become negative far outside the simulated range
+'''
+
+def basis(n_SM,n_up,n_down):
+    return (n_up-n_down)/2,(n_up+n_down)/2-n_SM
+
+#SM template (n_bins,) and basis templates (n_couplings,n_bins) of the couplings (default: all of coupling_shift) from the histograms saved by FCCee_topEWK.py
+def load_basis(array_dir,ntuples,charge="lminus",couplings=list(coupling_shift)):
+    n_SM = load_templates(array_dir,[""],ntuples,charge)[0]
+    n_up = load_templates(array_dir,["{}up_".format(coupling) for coupling in couplings],ntuples,charge)
+    n_down = load_templates(array_dir,["{}down_".format(coupling) for coupling in couplings],ntuples,charge)
+    L,Q = basis(n_SM,n_up,n_down)
+    return {"couplings": list(couplings),"n_SM": n_SM,"L": L,"Q": Q}
+
+#predicted distributions for a batch of coupling points g with shape (n_points,n_couplings) (or (n_couplings,) for a single point) in the units of coupling_shift, returns (n_points,n_bins). reshape=True returns the 2D (x,cosTheta) histograms instead
+def morph(g,morph_basis,reshape=False):
+    t = np.atleast_2d(g)/np.array([coupling_shift[coupling] for coupling in morph_basis["couplings"]])
+    n = morph_basis["n_SM"]+t@morph_basis["L"]+(t**2)@morph_basis["Q"]
+    return n.reshape(len(n),x_axis[0],cosTheta_axis[0]) if reshape else n
+
+#coupling points on a regular grid, e.g. scan_points({"ta_ttA": np.linspace(-0.5,0.5,101)},morph_basis) for a 1D scan with the other couplings at their SM value (0)
+def scan_points(grids,morph_basis):
+    axes = [grids.get(coupling,np.zeros(1)) for coupling in morph_basis["couplings"]]
+    return np.stack([axis.ravel() for axis in np.meshgrid(*axes,indexing="ij")],axis=-1)
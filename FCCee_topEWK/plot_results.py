@@ -0,0 +1,117 @@
+import math
+import pickle
+import numpy as np
+import multiprocessing
+from pathlib import Path
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from cut_flow_functions import W_leptons
+from histograms import x_axis,cosTheta_axis,edges
+from results_archive import open_archive,archive_path,select_counts
+
+'''
+Plotting stage of FCCee_topEWK.py, run after the analysis on the saved results:
+    - x and cosTheta projections of the (x,cosTheta) histograms of the negative leptons for each coupling, together with the (BSM-SM) difference (read from the memory-mapped results archive, see results_archive.py)
+    - Delta chi2 profiles of the chi2 fits (chi2_fit.pkl, see chi2_fit.py)
+Every figure is one job of a process pool. matplotlib (with the non-interactive Agg backend) is only imported inside the plotting jobs, i.e. the analysis itself never loads it. E.g. to redraw all figures after a style change:
+    python plot_results.py --BSM_mod "" ta_ttAdown_
+'''
+
+#Define custom colours
+kit_green100=(0,.59,.51)
+kit_green15=(.85,.93,.93)
+
+def pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+#semileptonic (tlepThad+thadTlep) and allhadronic (thadThad) projection of the lminus histograms onto x (sum over cosTheta) or cosTheta (sum over x)
+def projections(archive,BSM_coupling,ntuples,projection):
+    axis = 2 if projection=="x" else 1
+    counts = select_counts(archive,[BSM_coupling],ntuples,"lminus")[0].sum(axis=axis)
+    counts_SL = sum(counts[i] for i,channel in enumerate(ntuples) if W_leptons(channel)==1)
+    counts_AH = sum(counts[i] for i,channel in enumerate(ntuples) if W_leptons(channel)==0)
+    return counts_SL,counts_AH
+
+projection_style = {"x": {"edges": edges(x_axis),"xticks": np.arange(0,1.1,0.1),"xlabel": r"$x$","name": "Reduced energy","file": "x_lminus"},
+                    "cosTheta": {"edges": edges(cosTheta_axis),"xticks": np.arange(-1,1.2,0.2),"xlabel": r"$\cos\theta$","name": "Angular distribution","file": "cosTheta_lminus"}}
+
+def plot_projection(array_dir,figure_dir,BSM_coupling,ntuples,projection):
+    plt = pyplot()
+    style = projection_style[projection]
+    archive = open_archive(archive_path(array_dir))
+    counts_SL,counts_AH = projections(archive,BSM_coupling,ntuples,projection)
+    counts_SL_SM,counts_AH_SM = projections(archive,"",ntuples,projection)
+    fig, (ax1,ax2) = plt.subplots(2,1,sharex=True)
+    ax1.stairs(counts_SL,style["edges"],hatch="///",color=kit_green100,fill=True,label="semileptonic signal")
+    ax1.stairs(counts_AH,style["edges"],hatch="||",color=kit_green15,fill=True,label="full hadronic signal")
+    ax1.set_xticks(style["xticks"])
+    ax1.set_yscale("log")
+    ax1.set_yticks([1,10,10**2,10**3,10**4])
+    ax1.set_yticklabels(["1","10",r"$10^2$",r"$10^3$",r"$10^4$"])
+    ax1.set_ylabel(r"Number of events")
+    ax1.legend()
+    if BSM_coupling=="":
+        ax1.set_title(r"{} for SM coupling".format(style["name"]))
+    if BSM_coupling!="":
+        ax1.set_title(r"{} for modified ({}) coupling".format(style["name"],BSM_coupling[:-1]))
+    ax2.stairs(counts_SL-counts_SL_SM,style["edges"],color="red",label="semileptonic signal")
+    ax2.stairs(counts_AH-counts_AH_SM,style["edges"],color="blue",label="full hadronic signal")
+    ax2.set_xticks(style["xticks"])
+    ax2.set_xlabel(style["xlabel"])
+    ax2.set_ylabel(r"Number of events")
+    ax2.legend()
+    if BSM_coupling=="":
+        ax2.set_title(r"$\Delta(\mathrm{{SM-SM}})$")
+    if BSM_coupling!="":
+        ax2.set_title(r"$\Delta(\mathrm{{BSM-SM}})$ for {} modification".format(BSM_coupling[:-1]))
+    plt.suptitle(r"{} for $l\in\{{e^-,\mu^-\}}$ after cuts".format(style["name"]),fontweight='bold')
+    plt.savefig(Path(figure_dir)/"ee_tt_SM_{}{}.png".format(BSM_coupling,style["file"]),dpi=300)
+    plt.close()
+
+def plot_Delta_chi2(figure_dir,BSM_coupling,fit_result):
+    plt = pyplot()
+    from matplotlib.patches import Rectangle
+    k_min = fit_result["k_min"]
+    k_std = fit_result["k_std"]
+    power_min = int("{:.2e}".format(k_min).split('e')[1])
+    power_std = int("{:.2e}".format(k_std).split('e')[1])
+    fig, ax = plt.subplots()
+    ax.plot(fit_result["k_profile"],fit_result["Delta_chi2"],color="blue")
+    ax.grid()
+    ax.vlines(k_min,0,100,colors="red")
+    ax.add_patch(Rectangle((-k_std+k_min,0), 2*k_std, 100,facecolor='mediumseagreen',fill=True))
+    ax.set_ylim(0,3)
+    ax.set_xlim(-2*k_std+k_min,2*k_std+k_min)
+    ax.set_xlabel(r"$\delta$")
+    ax.set_ylabel(r"$\Delta \chi^2$")
+    #specify title format -> print 0 if k_min==0, otherwise k_min = x*10^y
+    plt.title(r"$\delta_{{\mathrm{{{}}}}}={:.2f}\pm{:.4f}\cdot 10^{{{:+d}}}$".format(BSM_coupling[:-1].replace("_", r"\_"), k_min*math.pow(10,-power_min),k_std*math.pow(10,-power_std),power_std)) if k_min==0 else plt.title(r"$\delta_{{\mathrm{{{}}}}}={:.2f}\cdot 10^{{{:+d}}}\pm{:.4f}\cdot 10^{{{:+d}}}$".format(BSM_coupling[:-1].replace("_", r"\_"), k_min*math.pow(10,-power_min),power_min,k_std*math.pow(10,-power_std),power_std))
+    plt.savefig(Path(figure_dir)/"Delta_chi2_SM_{}.png".format(BSM_coupling),dpi=300)
+    plt.close()
+
+#render all figures of a run in parallel (n_workers=None uses all cores)
+def render_all(array_dir,figure_dir,BSM_mod,ntuples,n_workers=None):
+    Path(figure_dir).mkdir(parents=True,exist_ok=True)
+    fit_path = Path(array_dir)/"chi2_fit.pkl"
+    fit_results = {}
+    if fit_path.exists():
+        with open(fit_path,"rb") as f:
+            fit_results = pickle.load(f)
+    with ProcessPoolExecutor(max_workers=n_workers,mp_context=multiprocessing.get_context("fork")) as pool:
+        jobs = [pool.submit(plot_projection,array_dir,figure_dir,BSM_coupling,ntuples,projection) for BSM_coupling in BSM_mod for projection in projection_style]
+        jobs += [pool.submit(plot_Delta_chi2,figure_dir,BSM_coupling,fit_results[BSM_coupling]) for BSM_coupling in fit_results]
+        for job in jobs:
+            job.result()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Render the figures of a finished FCCee_topEWK.py run")
+    parser.add_argument("--array_dir",default="/home/skeilbach/FCCee_topEWK/arrays")
+    parser.add_argument("--figure_dir",default="/home/skeilbach/FCCee_topEWK/figures")
+    parser.add_argument("--BSM_mod",nargs="+",default=["","ta_ttAdown_"])
+    parser.add_argument("--ntuples",nargs="+",default=["tlepThad","thadTlep","thadThad"])
+    parser.add_argument("--n_workers",type=int,default=None)
+    args = parser.parse_args()
+    render_all(args.array_dir,args.figure_dir,args.BSM_mod,args.ntuples,args.n_workers)
@@ -0,0 +1,52 @@
+import time
+import resource
+import numpy as np
+import awkward as ak
+from tabulate import tabulate
+
+'''
+Optional instrumentation of the cut-flow: for each cut in cut_dic the wall time, the increase of the peak RSS of the process and the number of events and leptons before/after the cut are recorded (see cut_flow(...,profile=[]))
+'''
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024 #ru_maxrss is given in kB on linux -> MB
+
+#the time is read before the leptons are counted for the snapshot after a cut (start=False) and after counting for the snapshot before a cut (start=True), i.e. the wall time only covers the cut itself
+def snapshot(masks,start=False):
+    now,rss = time.perf_counter(),peak_rss()
+    n_objects = sum(int(ak.sum(masks[lepton_name][masks["event"]])) for lepton_name in ["electron","muon"])
+    return {"time": time.perf_counter() if start else now,"peak_rss": rss,"events": int(np.count_nonzero(masks["event"])),"objects": n_objects}
+
+def record(cut_name,before,after):
+    wall_time = after["time"]-before["time"]
+    return {"cut": cut_name,
+            "wall time [s]": wall_time,
+            "peak RSS delta [MB]": after["peak_rss"]-before["peak_rss"],
+            "events in": before["events"],
+            "events out": after["events"],
+            "leptons in": before["objects"],
+            "leptons out": after["objects"],
+            "events/s": before["events"]/wall_time if wall_time>0 else np.inf}
+
+#add up the records of several chunks of the same sample (streaming mode). The records are matched by cut name since chunks that resume from the cut cache only have records for the cuts that were evaluated. cut_names gives the order of the merged records (the order of cut_dic)
+def merge_profiles(profiles,cut_names):
+    cut_records = {cut_name: [] for cut_name in cut_names}
+    for records in profiles:
+        for rec in records:
+            cut_records[rec["cut"]].append(rec)
+    merged = []
+    for records in cut_records.values():
+        if len(records)==0:
+            continue
+        tmp = dict(records[0]) #keep the order of the keys
+        for key in ["wall time [s]","events in","events out","leptons in","leptons out"]:
+            tmp[key] = sum(rec[key] for rec in records)
+        tmp["peak RSS delta [MB]"] = max(rec["peak RSS delta [MB]"] for rec in records)
+        tmp["events/s"] = tmp["events in"]/tmp["wall time [s]"] if tmp["wall time [s]"]>0 else np.inf
+        merged.append(tmp)
+    return merged
+
+def print_profile(profile_dic):
+    for channel in profile_dic:
+        print("cut-flow profile for {}:".format(channel))
+        print(tabulate(profile_dic[channel],headers="keys",tablefmt="grid"))
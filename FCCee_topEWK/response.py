@@ -0,0 +1,86 @@
+import numpy as np
+import awkward as ak
+from kinematics import phi,theta,pseudorap
+from cut_flow_functions import genW_mask,to_ak
+from histograms import x_axis,cosTheta_axis,bin_index
+
+'''
+Reco-gen matching of the leptons and response (migration) matrix of the (x,cosTheta) templates. Each reconstructed electron/muon is matched to the closest genElectron/genMuon from a W/t decay (see genW_mask) of the same event and flavour with dR < dr_max, all pairs of all events are built at once with ak.cartesian. The matched pairs are filled into a dense (reco bin x gen bin) matrix over the flattened 25x25 binning with one np.bincount:
+    migration[i,j] = number of leptons generated in (x,cosTheta) bin j and reconstructed in bin i after the cuts
+together with the gen distribution of all W/t leptons before the cuts ("gen", for the acceptance) and the reco distribution after the cuts ("reco", matched + fake leptons). All three are unnormalised counts times R and can be added over chunks/workers
+'''
+
+s = 365**2 #square of centre of mass energy in GeV
+m_t = 173.34 #m_t in GeV (taken from literature)
+beta = np.sqrt(1-(4*m_t**2)/s) #top velocity
+
+n_bins = x_axis[0]*cosTheta_axis[0]
+
+#reduced energy of the lepton in the top rest frame (same definition as in lxcosTheta)
+def reduced_energy(energy):
+    return 2*energy/m_t*np.sqrt((1-beta)/(1+beta))
+
+#flat (x,cosTheta) bin index of each lepton (-1 outside the axes)
+def xcosTheta_bin(energy,theta_lepton):
+    index_x = bin_index(ak.to_numpy(ak.flatten(reduced_energy(energy),axis=None)),x_axis)
+    index_cosTheta = bin_index(np.cos(ak.to_numpy(ak.flatten(theta_lepton,axis=None))),cosTheta_axis)
+    return np.where((index_x>=0)&(index_cosTheta>=0),index_x*cosTheta_axis[0]+index_cosTheta,-1)
+
+def gen_leptons(df_events,lepton_name):
+    genLepton = "gen{}".format(lepton_name.capitalize())
+    px,py,pz = to_ak(df_events["{}_px".format(genLepton)]),to_ak(df_events["{}_py".format(genLepton)]),to_ak(df_events["{}_pz".format(genLepton)])
+    gen_theta = theta(px,py,pz)
+    gen = ak.zip({"phi": phi(px,py),"eta": pseudorap(gen_theta),"theta": gen_theta,"energy": to_ak(df_events["{}_energy".format(genLepton)]),"charge": to_ak(df_events["{}_charge".format(genLepton)])})
+    return gen[genW_mask(to_ak(df_events["{}_parentPDG".format(genLepton)]))]
+
+#dR with the azimuthal difference wrapped into [-pi,pi)
+def delta_R(phi_1,eta_1,phi_2,eta_2):
+    delta_phi = np.mod(phi_1-phi_2+np.pi,2*np.pi)-np.pi
+    return np.sqrt(delta_phi**2+(eta_1-eta_2)**2)
+
+#closest W/t genLepton of each reco lepton, returns the reco leptons and their matched genLepton (None if there is no genLepton within dr_max)
+def match(df_events,lepton_name,dr_max=0.1):
+    reco = ak.zip({var: to_ak(df_events["{}_{}".format(lepton_name,var)]) for var in ["phi","eta","theta","energy","charge"]})
+    gen = gen_leptons(df_events,lepton_name)
+    pairs = ak.cartesian({"reco": reco,"gen": gen},axis=1,nested=True)
+    dr = delta_R(pairs.reco.phi,pairs.reco.eta,pairs.gen.phi,pairs.gen.eta)
+    closest = ak.argmin(dr,axis=2,keepdims=True)
+    matched = ak.firsts(dr[closest],axis=2) < dr_max
+    gen_matched = ak.firsts(pairs.gen[closest],axis=2)
+    return reco,ak.mask(gen_matched,ak.fill_none(matched,False))
+
+#gen distribution of the W/t leptons with the given charge in all events (before the cuts)
+def gen_hist(df_events,charge,R=1.):
+    counts = np.zeros(n_bins)
+    for lepton_name in ["electron","muon"]:
+        gen = gen_leptons(df_events,lepton_name)
+        gen = gen[gen.charge==charge]
+        index = xcosTheta_bin(gen.energy,gen.theta)
+        counts += np.bincount(index[index>=0],minlength=n_bins)
+    return R*counts
+
+#migration matrix and reco distribution of the leptons with the given (reco) charge in the events after the cuts (see materialise)
+def migration_matrix(df_events,charge,R=1.,dr_max=0.1):
+    migration,reco_counts = np.zeros((n_bins,n_bins)),np.zeros(n_bins)
+    for lepton_name in ["electron","muon"]:
+        reco,gen = match(df_events,lepton_name,dr_max)
+        selected = reco.charge==charge
+        reco,gen = reco[selected],gen[selected]
+        index_reco = xcosTheta_bin(reco.energy,reco.theta)
+        reco_counts += np.bincount(index_reco[index_reco>=0],minlength=n_bins)
+        is_matched = ak.to_numpy(ak.flatten(~ak.is_none(gen,axis=1)))
+        index_gen = np.where(is_matched,xcosTheta_bin(ak.fill_none(gen.energy,0.,axis=1),ak.fill_none(gen.theta,0.,axis=1)),-1) #fill_none keeps the unmatched leptons aligned with index_reco
+        filled = (index_reco>=0)&(index_gen>=0)
+        migration += np.bincount(index_reco[filled]*n_bins+index_gen[filled],minlength=n_bins**2).reshape(n_bins,n_bins)
+    return R*migration,R*reco_counts
+
+#response of one sample (or chunk): df_all are the events before the cuts, df_cut the events after the cuts
+def response(df_all,df_cut,R=1.,dr_max=0.1):
+    result = {}
+    for charge,name in [(+1,"lplus"),(-1,"lminus")]:
+        migration,reco_counts = migration_matrix(df_cut,charge,R,dr_max) if len(df_cut)>0 else (np.zeros((n_bins,n_bins)),np.zeros(n_bins))
+        result[name] = {"migration": migration,"gen": gen_hist(df_all,charge,R),"reco": reco_counts}
+    return result
+
+#branches needed in addition to required_branches(cut_dic,cut_limits) for the response
+response_branches = ["gen{}_{}".format(lepton_name,var) for lepton_name in ["Electron","Muon"] for var in ["px","py","pz","energy","charge","parentPDG"]]+["{}_{}".format(lepton_name,var) for lepton_name in ["electron","muon"] for var in ["phi","eta","energy","charge"]]
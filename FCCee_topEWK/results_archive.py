@@ -0,0 +1,104 @@
+import json
+import struct
+import zipfile
+import numpy as np
+from pathlib import Path
+from histograms import x_axis,cosTheta_axis,edges
+
+'''
+One results archive <array_dir>/results.npz per run of FCCee_topEWK.py instead of the counts_*.npy/table_*.pkl files per coupling. The archive is an uncompressed npz (np.savez) holding
+    counts            (n_couplings,n_channels,2,25,25) (x,cosTheta) histograms after the cuts, charge axis ordered as charges ("lplus","lminus")
+    outside           (n_couplings,n_channels,2) number of leptons after the cuts outside the (x,cosTheta) axes (e.g. x > 1), i.e. not in counts
+    table_s           (n_couplings,n_channels,n_cuts) number of signal events after each cut (times R, see cut_flow)
+    R                 (n_couplings,n_channels) normalisation of the samples
+    x_edges,cosTheta_edges
+    migration,gen,reco  (n_couplings,n_channels,2,...) response of the templates, only if the run was done with response_matrix=True (see response.py)
+    replicas          (n_couplings,n_channels,n_bootstrap,n_cuts) bootstrap replicas of table_s, only if the run was done with n_bootstrap (see bootstrap.py)
+    index             JSON with the order of the couplings/channels/charges/cuts, the axes, the cut configuration (cut functions and limits), the efficiency/purity tables of signal_eff_pur and the metadata sidecars of the samples (see sample_meta.py)
+The members of an uncompressed zip are stored contiguously, i.e. open_archive maps each array directly from the file with np.memmap (nothing is read until it is sliced) and the fits/plots only read the (coupling,channel,charge) slices they need, e.g.
+    archive = open_archive(archive_path(array_dir))
+    counts_SM = archive["counts"][archive["index"]["couplings"].index("")]
+'''
+
+charges = ["lplus","lminus"]
+
+def archive_path(array_dir):
+    return Path(array_dir)/"results.npz"
+
+#results of run_parallel (see cut_flow_driver.py), tables: {BSM_coupling: {"semileptonic": table_SL,"allhadronic": table_AH}} from signal_eff_pur, samples: {BSM_coupling: {channel: sample metadata}}
+def write_archive(path,results,tables,cut_dic,cut_limits,samples):
+    BSM_mod = list(results)
+    ntuples = list(results[BSM_mod[0]])
+    channel_results = [[results[BSM_coupling][channel] for channel in ntuples] for BSM_coupling in BSM_mod]
+    arrays = {"counts": np.array([[[result["counts_{}".format(charge)] for charge in charges] for result in row] for row in channel_results]),
+              "table_s": np.array([[result["table"] for result in row] for row in channel_results]),
+              "outside": np.array([[result["outside"] for result in row] for row in channel_results]),
+              "R": np.array([[result["R"] for result in row] for row in channel_results]),
+              "x_edges": edges(x_axis),
+              "cosTheta_edges": edges(cosTheta_axis)}
+    if all("response" in result for row in channel_results for result in row):
+        for name in ["migration","gen","reco"]:
+            arrays[name] = np.array([[[result["response"][charge][name] for charge in charges] for result in row] for row in channel_results])
+    if all("replicas" in result for row in channel_results for result in row):
+        arrays["replicas"] = np.array([[result["replicas"] for result in row] for row in channel_results])
+    index = {"couplings": BSM_mod,"channels": ntuples,"charges": charges,"cuts": list(cut_dic),
+             "axes": {"x": x_axis,"cosTheta": cosTheta_axis},
+             "cut_config": {cut_name: {"function": cut_dic[cut_name].__name__,"limits": cut_limits[cut_name]} for cut_name in cut_dic},
+             "tables": tables,
+             "samples": samples}
+    arrays["index"] = np.array(json.dumps(index,default=float))
+    path = Path(path)
+    path.parent.mkdir(parents=True,exist_ok=True)
+    #write to a temporary file first so that a running fit/plot job never reads a half written archive
+    tmp_path = path.with_name(path.name+".tmp")
+    with open(tmp_path,"wb") as f:
+        np.savez(f,**arrays)
+    tmp_path.replace(path)
+
+#offset of the data of each member in the zip file (local file header of 30 bytes + file name + extra field)
+def member_offsets(path):
+    offsets = {}
+    with zipfile.ZipFile(path) as archive, open(path,"rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("{} is compressed and can not be memory-mapped".format(info.filename))
+            f.seek(info.header_offset+26)
+            name_length,extra_length = struct.unpack("<HH",f.read(4))
+            offsets[info.filename[:-len(".npy")]] = info.header_offset+30+name_length+extra_length
+    return offsets
+
+def map_member(path,offset):
+    with open(path,"rb") as f:
+        f.seek(offset)
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version==(1,0) else np.lib.format.read_array_header_2_0
+        shape,fortran_order,dtype = read_header(f)
+        data_offset = f.tell()
+    if np.prod(shape)==0:
+        return np.empty(shape,dtype=dtype)
+    return np.memmap(path,dtype=dtype,mode="r",offset=data_offset,shape=shape,order="F" if fortran_order else "C")
+
+#{"index": index,name: read-only memmap of each array}
+def open_archive(path):
+    offsets = member_offsets(path)
+    with np.load(path) as f:
+        archive = {"index": json.loads(str(f["index"]))}
+    for name,offset in offsets.items():
+        if name != "index":
+            archive[name] = map_member(path,offset)
+    return archive
+
+#histograms of the couplings in BSM_mod and channels in ntuples with the given charge, shape (n_couplings,n_channels,25,25). Only these slices are read from the file
+def select_counts(archive,BSM_mod,ntuples,charge="lminus"):
+    index = archive["index"]
+    couplings = [index["couplings"].index(BSM_coupling) for BSM_coupling in BSM_mod]
+    channels = [index["channels"].index(channel) for channel in ntuples]
+    return archive["counts"][np.ix_(couplings,channels,[charges.index(charge)])][:,:,0]
+
+#sum of the (x,cosTheta) histograms of all channels in ntuples for each coupling, flattened to (n_couplings,n_bins), from the archive of the run in array_dir. An empty BSM_mod (e.g. an SM-only run) gives an empty (0,n_bins) array
+def load_templates(array_dir,BSM_mod,ntuples,charge="lminus"):
+    archive = open_archive(archive_path(array_dir))
+    if len(BSM_mod)==0:
+        return np.zeros((0,np.prod(archive["counts"].shape[-2:])))
+    counts = select_counts(archive,BSM_mod,ntuples,charge)
+    return counts.sum(axis=1).reshape(len(BSM_mod),-1)
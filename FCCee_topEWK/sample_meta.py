@@ -0,0 +1,67 @@
+import json
+import hashlib
+import numpy as np
+from pathlib import Path
+
+'''
+Metadata sidecar <sample>.meta.json next to each sample (<name>.pkl.meta.json for the pickle, <name>.meta.json for the columnar store directory, see event_store.py) holding
+    - the number of events
+    - the number of events per truth class (genW_leptons, see truth_class in cut_flow_functions.py)
+    - size, modification time and sha256 of the sample
+The sidecar is built once on the first load. It is valid as long as size and modification time of the sample are unchanged; if only the modification time changed (e.g. the file was copied) the hash is compared and the sidecar is updated if the content is the same. With the truth class counts the normalisation R = N_exp/N_df of a sample is known without reading it
+'''
+
+def meta_path(sample_file):
+    sample_file = Path(sample_file)
+    return sample_file.with_name("{}.meta.json".format(sample_file.name))
+
+#the columnar store is a directory, its size/modification time/hash are taken over all files in it
+def sample_files(sample_file):
+    sample_file = Path(sample_file)
+    return sorted(sample_file.iterdir()) if sample_file.is_dir() else [sample_file]
+
+def file_stat(sample_file):
+    stats = [f.stat() for f in sample_files(sample_file)]
+    return {"size": sum(stat.st_size for stat in stats),"mtime": max(stat.st_mtime_ns for stat in stats)}
+
+def file_hash(sample_file,block_size=2**24):
+    sha256 = hashlib.sha256()
+    for f in sample_files(sample_file):
+        sha256.update(f.name.encode())
+        with open(f,"rb") as stream:
+            for block in iter(lambda: stream.read(block_size),b""):
+                sha256.update(block)
+    return sha256.hexdigest()
+
+def write_meta(sample_file,genW_leptons):
+    truth_counts = np.bincount(np.asarray(genW_leptons,dtype=np.int64))
+    meta = {"file": Path(sample_file).name,
+            **file_stat(sample_file),
+            "sha256": file_hash(sample_file),
+            "n_events": len(genW_leptons),
+            "truth_counts": {str(truth): int(count) for truth,count in enumerate(truth_counts) if count>0}}
+    meta_path(sample_file).write_text(json.dumps(meta,indent=1))
+    return meta
+
+#returns the metadata of the sample or None if there is no valid sidecar
+def read_meta(sample_file):
+    if not meta_path(sample_file).exists():
+        return None
+    meta = json.loads(meta_path(sample_file).read_text())
+    stat = file_stat(sample_file)
+    if (meta["size"],meta["mtime"]) == (stat["size"],stat["mtime"]):
+        return meta
+    if meta["size"] == stat["size"] and meta["sha256"] == file_hash(sample_file):
+        meta["mtime"] = stat["mtime"]
+        meta_path(sample_file).write_text(json.dumps(meta,indent=1))
+        return meta
+    return None
+
+#metadata of the sample, the sidecar is (re)built from the truth classes genW_leptons of all events if it is missing or outdated
+def load_meta(sample_file,genW_leptons):
+    meta = read_meta(sample_file)
+    return meta if meta is not None else write_meta(sample_file,genW_leptons)
+
+#number of signal events (n_Wleptons leptons from W/t decays) in the sample
+def signal_events(meta,n_Wleptons):
+    return meta["truth_counts"].get(str(2*n_Wleptons),0)
@@ -41,6 +41,13 @@ xsec_variation['tv_ttAdown_'] = 1.051
 xsec_variation['vr_ttZup_']   = 0.954
 xsec_variation['vr_ttZdown_'] = 1.065
 
+## size of the up/down shift of each coupling in the variation samples (see above)
+coupling_shift = {
+       "ta_ttA" : 0.424237,
+       "tv_ttA" : 0.010606,
+       "vr_ttZ" : 0.17638
+      }
+
 ## number of events expected from each process under given parameters
 N_expect = {}
 for process in BRs:
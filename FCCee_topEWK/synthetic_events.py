@@ -0,0 +1,92 @@
+import numpy as np
+import awkward as ak
+from cut_flow_functions import W_leptons
+from event_store import events_to_df
+
+'''
+Generator for synthetic FCC-ee-like ttbar events with the same (jagged) branch layout as the ntuples in /ceph/skeilbach (lepton/jet kinematics, d0, Emiss, genLeptons with parentPDG). The physics is only roughly modelled, the generator is meant for benchmarking and testing the cut-flow without access to the real samples
+'''
+
+m_t = 173.34 #top mass in GeV
+s = 365**2 #square of centre of mass energy in GeV
+sigma_angle = 0.005 #angular resolution of the reco leptons in rad
+
+#random directions unless theta/phi are given
+def kinematics(rng,energy,theta=None,phi=None):
+    theta = np.arccos(rng.uniform(-1,1,len(energy))) if theta is None else theta
+    phi = rng.uniform(-np.pi,np.pi,len(energy)) if phi is None else phi
+    return {"px": energy*np.sin(theta)*np.cos(phi),"py": energy*np.sin(theta)*np.sin(phi),"pz": energy*np.cos(theta),"phi": phi,"eta": -np.log(np.tan(theta/2)),"energy": energy}
+
+#build jagged arrays from the flat values and the number of entries per event
+def jagged(values,counts):
+    return {var: ak.unflatten(values[var],counts) for var in values}
+
+#returns the events as awkward array (as_df=False) or as df with the jagged branches stored as lists like in the pickled ntuples
+def synthetic_events(n_events,channel="tlepThad",jet_algo="kt_exactly6",seed=42,as_df=True):
+    rng = np.random.default_rng(seed)
+    n_Wleptons = W_leptons(channel)
+    beta = np.sqrt(1-(4*m_t**2)/s)
+    branches = {}
+    #leptons from the W decay (reduced energy x uniform in the kinematically allowed range) + soft fake leptons from B-meson decays inside jets
+    is_electron = rng.random(n_events) < 0.5
+    charge_W = rng.choice([-1.,1.],n_events)
+    x = rng.uniform(0.2,1.,n_events)
+    E_W = x*m_t/2*np.sqrt((1+beta)/(1-beta))
+    #direction of the W lepton: the genLepton entries carry it exactly, the reco lepton is smeared by sigma_angle (well inside the dR < 0.1 of the reco-gen matching, see response.py)
+    theta_W,phi_W = np.arccos(rng.uniform(-1,1,n_events)),rng.uniform(-np.pi,np.pi,n_events)
+    n_fake = {"electron": rng.poisson(0.3,n_events),"muon": rng.poisson(0.3,n_events)}
+    gen_counts = {}
+    for lepton_name,mask_flavour in [("electron",is_electron),("muon",~is_electron)]:
+        has_W = mask_flavour&(n_Wleptons>0)
+        counts = has_W.astype(np.int64)+n_fake[lepton_name]
+        n_tot = counts.sum()
+        #W lepton first, fake leptons after
+        first = np.zeros(n_tot,dtype=bool)
+        offsets = np.concatenate(([0],np.cumsum(counts)))
+        first[offsets[:-1][has_W]] = True
+        energy = rng.exponential(5.,n_tot)+1.
+        energy[first] = E_W[has_W]
+        charge = rng.choice([-1.,1.],n_tot)
+        charge[first] = charge_W[has_W]
+        theta,phi = np.arccos(rng.uniform(-1,1,n_tot)),rng.uniform(-np.pi,np.pi,n_tot)
+        theta[first] = np.clip(theta_W[has_W]+rng.normal(0,sigma_angle,has_W.sum()),1e-3,np.pi-1e-3)
+        phi[first] = np.mod(phi_W[has_W]+rng.normal(0,sigma_angle,has_W.sum())+np.pi,2*np.pi)-np.pi
+        values = kinematics(rng,energy,theta,phi)
+        values["charge"] = charge
+        values["d0"] = np.where(first,np.abs(rng.normal(0,0.01,n_tot)),np.abs(rng.normal(0,0.3,n_tot)))
+        values["d0signif"] = np.where(first,np.abs(rng.normal(0,2.,n_tot)),rng.exponential(40.,n_tot))
+        for var,array in jagged(values,counts).items():
+            branches["{}_{}".format(lepton_name,var)] = array
+        #genLeptons: the W lepton is listed twice (with the W and the t as parent), fake leptons with a meson as parent
+        gen_counts[lepton_name] = 2*has_W.astype(np.int64)+n_fake[lepton_name]
+        n_gen = gen_counts[lepton_name].sum()
+        gen_offsets = np.concatenate(([0],np.cumsum(gen_counts[lepton_name])))
+        gen_first = np.zeros(n_gen,dtype=bool)
+        gen_first[gen_offsets[:-1][has_W]] = True
+        gen_second = np.roll(gen_first,1)
+        parentPDG = rng.choice([411,421,511,521],n_gen)*rng.choice([-1,1],n_gen)
+        gen_charge = rng.choice([-1.,1.],n_gen)
+        gen_charge[gen_first],gen_charge[gen_second] = charge_W[has_W],charge_W[has_W]
+        parentPDG[gen_first],parentPDG[gen_second] = 24*charge_W[has_W].astype(int),6*charge_W[has_W].astype(int)
+        gen_energy = rng.exponential(5.,n_gen)+1.
+        gen_energy[gen_first],gen_energy[gen_second] = E_W[has_W],E_W[has_W]
+        gen_theta,gen_phi = np.arccos(rng.uniform(-1,1,n_gen)),rng.uniform(-np.pi,np.pi,n_gen)
+        gen_theta[gen_first],gen_theta[gen_second] = theta_W[has_W],theta_W[has_W]
+        gen_phi[gen_first],gen_phi[gen_second] = phi_W[has_W],phi_W[has_W]
+        gen_values = kinematics(rng,gen_energy,gen_theta,gen_phi)
+        genLepton = "gen{}".format(lepton_name.capitalize())
+        for var in ["px","py","pz","energy"]:
+            branches["{}_{}".format(genLepton,var)] = ak.unflatten(gen_values[var],gen_counts[lepton_name])
+        branches["{}_charge".format(genLepton)] = ak.unflatten(gen_charge,gen_counts[lepton_name])
+        branches["{}_parentPDG".format(genLepton)] = ak.unflatten(parentPDG,gen_counts[lepton_name])
+    #exclusive 6 jet reconstruction
+    jet_counts = np.full(n_events,6)
+    jet_values = kinematics(rng,rng.uniform(10.,100.,6*n_events))
+    for var in ["px","py","pz","phi","eta","energy"]:
+        branches["jet_{}_{}".format(jet_algo,var)] = ak.unflatten(jet_values[var],jet_counts)
+    #missing energy from the neutrino of the W decay
+    branches["Emiss_energy"] = np.where(rng.random(n_events) < (0.9 if n_Wleptons>0 else 0.1),rng.uniform(10.,120.,n_events),rng.exponential(10.,n_events))
+    df_events = ak.Array(branches)
+    if not as_df:
+        return df_events
+    return events_to_df(df_events)
@@ -0,0 +1,28 @@
+import numpy as np
+from chi2_fit import coefficients,fit_analytic,fit_parallel
+from results_archive import write_archive,archive_path,load_templates
+
+#same shapes as in FCCee_topEWK.py: n_i = n_SM of shape (n_bins,) and n_mod of shape (n_couplings,n_bins)
+def test_fit_parallel_1d_data_2d_templates():
+    rng = np.random.default_rng(1)
+    n_SM = rng.uniform(10,100,size=625)
+    n_mod = n_SM*rng.uniform(0.9,1.1,size=(2,625))
+    fits = fit_parallel(n_SM,n_SM,n_mod,["mod_a","mod_b"],n_workers=2)
+    assert list(fits) == ["mod_a","mod_b"]
+    a,b,c = coefficients(n_SM,n_SM,n_mod)
+    assert np.shape(c) == (2,)
+    analytic = fit_analytic(a,b,c)
+    for i,fit in enumerate(fits.values()):
+        assert fit["valid"]
+        assert abs(fit["k_min"]-analytic["k_min"][i]) < 1e-6
+        assert np.isclose(fit["k_std"],analytic["k_std"][i],rtol=1e-3)
+
+#SM-only run (BSM_mod = [""]): no couplings to fit, the driver loads an empty template list from the archive
+def test_fit_parallel_no_couplings(tmp_path):
+    counts = np.ones((25,25))
+    results = {"": {"tlepThad": {"counts_lplus": counts,"counts_lminus": counts,"outside": np.zeros(2),"table": np.ones(1),"R": 1.}}}
+    write_archive(archive_path(tmp_path),results,{"": {}},{"cut1": len},{"cut1": {}},{"": {}})
+    n_SM = load_templates(tmp_path,[""],["tlepThad"])[0]
+    n_mod = load_templates(tmp_path,[],["tlepThad"])
+    assert n_mod.shape == (0,625)
+    assert fit_parallel(n_SM,n_SM,n_mod,[],n_workers=1) == {}
@@ -0,0 +1,20 @@
+import io
+import contextlib
+import numpy as np
+from benchmark import cut_dic,cut_limits
+from synthetic_events import synthetic_events
+from cut_flow_functions import cut_flow,truth_class,to_events
+from response import response
+
+#the W leptons of the synthetic events are reconstructed along their gen direction, i.e. they are matched and end up in the migration matrix (mostly on the diagonal)
+def test_matched_leptons_fill_migration():
+    df = synthetic_events(2000,"tlepThad",seed=1)
+    df["genW_leptons"] = truth_class(df)
+    df_events = to_events(df)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_cut,_ = cut_flow(df_events,cut_dic,cut_limits,"tlepThad",1.)
+    for charge,result in response(df_events,df_cut).items():
+        migration = result["migration"]
+        assert migration.sum() > 0.9*result["reco"].sum()
+        assert np.trace(migration) > 0.9*migration.sum()
+        assert np.all(migration.sum(axis=0) <= result["gen"])
@@ -0,0 +1,78 @@
+import time
+import numpy as np
+from argparse import ArgumentParser
+from tabulate import tabulate
+from chi2_fit import coefficients
+from results_archive import load_templates
+
+'''
+Toy Monte Carlo pseudo-experiments for the sensitivity to a BSM coupling. The toys are Poisson fluctuations of the template n_SM+k_true*(n_mod-n_SM) (k_true=0: SM), n_toys toys are drawn as one (n_toys,n_bins) array per chunk and the linear template parameter k is fitted for all of them at once:
+    method="chi2"     closed-form minimum of the chi2 used in FCCee_topEWK.py (see chi2_fit.py) with the toy as n_i
+    method="poisson"  vectorized Newton iterations on -2lnL of the Poisson likelihood, started from the chi2 solution
+The bias of k, the mean and width of the pulls (k-k_true)/k_std and the timing are reported, e.g.
+    python toy_mc.py --coupling ta_ttAdown_ --n_toys 100000
+'''
+
+def generate_toys(rng,n_true,n_toys):
+    return rng.poisson(n_true,size=(n_toys,len(n_true))).astype(np.float64)
+
+def fit_chi2(toys,n_SM,n_mod):
+    a,b,c = coefficients(toys,n_SM,n_mod)
+    return b/a,1/np.sqrt(a)
+
+#-2lnL = 2*sum_i (mu_i-n_i*ln(mu_i)) with mu_i = n_SM+k*(n_mod-n_SM), only bins with n_SM>0 enter the likelihood
+def fit_poisson(toys,n_SM,n_mod,n_iter=20,tol=1e-10):
+    bins = n_SM>0
+    toys,n_SM,delta = toys[:,bins],n_SM[bins],(n_mod-n_SM)[bins]
+    k,_ = fit_chi2(toys,n_SM,n_SM+delta)
+    for i in range(n_iter):
+        mu = n_SM+k[:,None]*delta
+        grad = 2*np.sum(delta*(1-toys/mu),axis=1)
+        hess = 2*np.sum(delta**2*toys/mu**2,axis=1)
+        step = grad/hess
+        k = k-step
+        if np.max(np.abs(step)) < tol:
+            break
+    mu = n_SM+k[:,None]*delta
+    return k,1/np.sqrt(np.sum(delta**2*toys/mu**2,axis=1)) #Delta(-2lnL)=1 from the curvature
+
+fit_methods = {"chi2": fit_chi2,"poisson": fit_poisson}
+
+#the toys are generated and fitted in chunks of chunk_size toys to bound the memory ((chunk_size,n_bins) float64 arrays)
+def run_toys(n_SM,n_mod,n_toys,k_true=0.,method="chi2",chunk_size=10000,seed=42):
+    rng = np.random.default_rng(seed)
+    n_true = n_SM+k_true*(n_mod-n_SM)
+    k,k_std = np.empty(n_toys),np.empty(n_toys)
+    t_generate,t_fit = 0.,0.
+    for start in range(0,n_toys,chunk_size):
+        stop = min(start+chunk_size,n_toys)
+        t0 = time.perf_counter()
+        toys = generate_toys(rng,n_true,stop-start)
+        t1 = time.perf_counter()
+        k[start:stop],k_std[start:stop] = fit_methods[method](toys,n_SM,n_mod)
+        t_generate,t_fit = t_generate+t1-t0,t_fit+time.perf_counter()-t1
+    pull = (k-k_true)/k_std
+    return {"k": k,"k_std": k_std,"pull": pull,
+            "summary": {"method": method,"n_toys": n_toys,"k_true": k_true,
+                        "bias": np.mean(k)-k_true,"k_std (toys)": np.std(k),"k_std (fit)": np.mean(k_std),
+                        "pull mean": np.mean(pull),"pull width": np.std(pull),
+                        "generation [s]": t_generate,"fit [s]": t_fit,"toys/s": n_toys/(t_generate+t_fit)}}
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Toy MC study of the fitted BSM coupling parameter k")
+    parser.add_argument("--array_dir",default="/home/skeilbach/FCCee_topEWK/arrays")
+    parser.add_argument("--coupling",nargs="+",default=["ta_ttAdown_"])
+    parser.add_argument("--ntuples",nargs="+",default=["tlepThad","thadTlep","thadThad"])
+    parser.add_argument("--n_toys",type=int,default=100000)
+    parser.add_argument("--k_true",type=float,default=0.)
+    parser.add_argument("--method",choices=list(fit_methods),nargs="+",default=["chi2","poisson"])
+    parser.add_argument("--chunk_size",type=int,default=10000)
+    parser.add_argument("--seed",type=int,default=42)
+    args = parser.parse_args()
+    n_SM = load_templates(args.array_dir,[""],args.ntuples)[0]
+    n_mod = load_templates(args.array_dir,args.coupling,args.ntuples)
+    table = []
+    for BSM_coupling,n_mod_coupling in zip(args.coupling,n_mod):
+        for method in args.method:
+            table.append({"coupling": BSM_coupling,**run_toys(n_SM,n_mod_coupling,args.n_toys,args.k_true,method,args.chunk_size,args.seed)["summary"]})
+    print(tabulate(table,headers="keys",tablefmt="grid"))